@@ -0,0 +1,848 @@
+# benchmarks for the engine, run from this directory with: python benchmark.py <benchmark> [options]
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import book
+import engine
+import evaluation
+import move_cache
+import move_finder
+import pgn
+import transposition
+
+
+# (name, FEN, known perft counts for depth 1, 2, 3...)
+# the first six are the standard perft positions, the rest target en passant, castling and promotion edge cases
+PERFT_POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+    ("en passant discovered check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     [15, 126, 1928]),
+    ("en passant along a pinned row", "8/8/8/K2pP2q/8/8/8/7k w - d6 0 1",
+     [6, 120, 776]),
+    ("en passant out of check", "8/8/8/2k5/3Pp3/8/8/4K3 b - d3 0 1",
+     [9, 50, 379]),
+    ("double push discovered check", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     [18, 92, 1670]),
+    ("castling rights lost to captures", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     [44, 1494, 50509]),
+    ("castling through check", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     [26, 1141, 27826]),
+    ("promotions", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+     [24, 496, 9483]),
+    ("underpromotion", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     [6, 27, 273]),
+]
+
+# (name, FEN, best move) of small tactics, each decided by a capture or a checkmate just beyond a shallow search's horizon
+TACTICS = [
+    ("defended rook or free knight", "4k3/8/4p3/3r4/n7/8/8/3QK3 w - - 0 1", "d1a4"),
+    ("knight fork", "r3k3/8/8/3N4/8/8/8/4K3 w - - 0 1", "d5c7"),
+    ("scholar's mate", "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", "h5f7"),
+    ("back rank mate", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", "d1d8"),
+    ("mate in two after a quiet king move", "2k5/8/2K5/8/8/8/8/1R6 w - - 0 1", "c6d6"),
+]
+
+# (label, move_finder.SearchConfig) of the selective search features compared by bench_selective
+SEARCH_CONFIGS = [
+    ("full width", move_finder.SearchConfig(nullMove=False, lateMoveReductions=False, futility=False)),
+    ("null move", move_finder.SearchConfig(nullMove=True, lateMoveReductions=False, futility=False)),
+    ("late move reductions", move_finder.SearchConfig(nullMove=False, lateMoveReductions=True, futility=False)),
+    ("futility", move_finder.SearchConfig(nullMove=False, lateMoveReductions=False, futility=True)),
+    ("all", move_finder.SearchConfig()),
+]
+
+
+def bench_backends(args):
+    """Compares nodes per second of move generation + make/undo between the board backends. """
+    for backend in ("array", "bitboard"):
+        state = engine.State(backend=backend)
+        start = time.perf_counter()
+        nodes = state.perft(args.depth)
+        elapsed = time.perf_counter() - start
+        print("{:<10} depth {}  nodes {:>8}  time {:7.2f}s  nps {:>9.0f}".format(
+            backend, args.depth, nodes, elapsed, nodes / elapsed))
+
+
+def bench_search(args):
+    """Compares the min-max search against the alpha-beta search (both without quiescence) in time and nodes. """
+    state = engine.State(backend=args.backend)
+
+    # both searches run without the quiescence search (which the bot's min-max scores its leaves with),
+    # so that min-max visits exactly the full tree and the alpha-beta nodes compare with it
+    search = move_finder.AlphaBetaSearch(0, scoreFunction=move_finder.get_board_score, quiescence=False)
+    start = time.perf_counter()
+    move_finder.get_best_move_min_max(state, state.get_valid_moves(), search)
+    elapsed = time.perf_counter() - start
+    fullTree = sum(state.perft(depth) for depth in range(move_finder.MAX_DEPTH + 1))
+    print("min-max     depth {}  nodes {:>8}  time {:7.2f}s  full tree {}  (no quiescence)".format(
+        move_finder.MAX_DEPTH, search.nodes, elapsed, fullTree))
+
+    for depth in range(1, args.depth + 1):
+        search = move_finder.AlphaBetaSearch(depth, quiescence=False)
+        start = time.perf_counter()
+        search.search(state, state.get_valid_moves())
+        elapsed = time.perf_counter() - start
+        nodes = search.nodes
+        fullTree = sum(state.perft(d) for d in range(depth + 1)) if depth <= 3 else None
+        print("alpha-beta  depth {}  nodes {:>8}  time {:7.2f}s  {}(no quiescence)".format(
+            depth, nodes, elapsed,
+            "full tree {} ({:.1%} searched)  ".format(fullTree, nodes / fullTree) if fullTree else ""))
+
+
+def play_opening(state, moves):
+    """Plays a list of moves given as (startRow, startCol, endRow, endCol) on the state. """
+    for startRow, startCol, endRow, endCol in moves:
+        state.make_move(engine.Move((startRow, startCol), (endRow, endCol), state.board))
+
+
+# 1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 (an open middlegame with many transpositions)
+ITALIAN_GAME = [(6, 4, 4, 4), (1, 4, 3, 4), (7, 6, 5, 5), (0, 1, 2, 2), (7, 5, 4, 2), (0, 5, 3, 2)]
+
+
+def bench_table(args):
+    """Compares the alpha-beta search with and without a transposition table. """
+    state = engine.State(backend=args.backend)
+    play_opening(state, ITALIAN_GAME)
+
+    for table in (None, transposition.TranspositionTable(args.size)):
+        start = time.perf_counter()
+        _, nodes = move_finder.get_best_move_alpha_beta(state, state.get_valid_moves(), args.depth, table)
+        elapsed = time.perf_counter() - start
+        print("{:<8} depth {}  nodes {:>8}  time {:7.2f}s".format(
+            "table" if table else "no table", args.depth, nodes, elapsed))
+        if table:
+            print("         " + ", ".join("{} {}".format(name, round(value, 3))
+                                          for name, value in table.stats().items()))
+            tableBytes = sum(slots.itemsize * len(slots) for slots in (table.keys, table.scores, table.data))
+            print("         usage {:.1%} of {} slots, {:.2f} MB (limit {} MB)".format(
+                table.usage(), len(table.data), tableBytes / 2 ** 20, args.size))
+
+
+def bench_iterative(args):
+    """Shows the depth the iterative deepening search reaches, and how long it takes, under a time budget. """
+    state = engine.State(backend=args.backend)
+    play_opening(state, ITALIAN_GAME)
+
+    for timeLimit in args.times:
+        search = move_finder.AlphaBetaSearch(move_finder.MAX_ITERATION_DEPTH)
+        start = time.perf_counter()
+        search.iterate(state, state.get_valid_moves(), timeLimit)
+        elapsed = time.perf_counter() - start
+        print("budget {:>6}ms  took {:>7.0f}ms  completed depth {}  nodes {:>8}".format(
+            timeLimit, elapsed * 1000, search.completedDepth, search.nodes))
+
+
+def random_positions(count, seed, backend="array", maxPlies=80):
+    """Yields `count` states reached by random play from the start position (the same ones for the same seed). """
+    rng = random.Random(seed)
+    produced = 0
+    while produced < count:
+        state = engine.State(backend=backend)
+        for _ in range(rng.randint(1, maxPlies)):
+            validMoves = state.get_valid_moves()
+            if not validMoves:
+                break
+            state.make_move(rng.choice(validMoves))
+        state.get_valid_moves()  # sets the checkmate and stalemate flags
+        produced += 1
+        yield state
+
+
+def bench_generators(args):
+    """
+    Times each move generator of the array backend on its own, per call, over the pieces of the side to move
+    in random positions (after update_legality_masks, as get_valid_moves would call them).
+    """
+    positions = list(random_positions(args.positions, args.seed))
+    generators = {"P": "get_pawn_moves", "N": "get_knight_moves", "B": "get_bishop_moves",
+                  "R": "get_rook_moves", "Q": "get_queen_moves", "K": "get_king_moves"}
+    times = {name: 0.0 for name in generators.values()}
+    calls = {name: 0 for name in generators.values()}
+    times["find_pins_and_checks"] = times["get_attack_map"] = 0.0
+    calls["find_pins_and_checks"] = calls["get_attack_map"] = 0
+
+    for state in positions:
+        state.update_legality_masks()
+        allyColor = "w" if state.whiteToMove else "b"
+        squares = [(i, j, state.board[i][j][1]) for i in range(8) for j in range(8)
+                   if state.board[i][j] and state.board[i][j][0] == allyColor]
+        for _ in range(args.repeat):
+            for name in ("find_pins_and_checks", "get_attack_map"):
+                function = getattr(state, name)
+                start = time.perf_counter()
+                function()
+                times[name] += time.perf_counter() - start
+                calls[name] += 1
+            for i, j, piece in squares:
+                name = generators[piece]
+                function = getattr(state, name)
+                moves = []
+                start = time.perf_counter()
+                function(i, j, moves)
+                times[name] += time.perf_counter() - start
+                calls[name] += 1
+
+    for name in times:
+        print("{:<22} {:8.2f}us per call".format(name, times[name] / calls[name] * 1e6))
+
+
+def bench_attacks(args):
+    """
+    Checks that the ray-based is_under_attack agrees with the move generation based implementation,
+    and compares their speed.
+    The generation based version is only a valid reference on squares holding a piece of the side to move
+    (so pawn pushes can not land there and pawn captures count), away from the opponent's king
+    (whose generated moves exclude squares that are defended).
+    """
+    positions = list(random_positions(args.positions, args.seed))
+    compared = mismatches = 0
+    fastTime = slowTime = 0.0
+
+    for state in positions:
+        allyColor = "w" if state.whiteToMove else "b"
+        enemyKing = state.blackKingPosition if state.whiteToMove else state.whiteKingPosition
+        for i in range(8):
+            for j in range(8):
+                start = time.perf_counter()
+                fast = state.is_under_attack(i, j)
+                fastTime += time.perf_counter() - start
+                start = time.perf_counter()
+                slow = state.is_under_attack_by_generation(i, j)
+                slowTime += time.perf_counter() - start
+
+                piece = state.board[i][j]
+                if not piece or piece[0] != allyColor:
+                    continue
+                if abs(i - enemyKing[0]) <= 1 and abs(j - enemyKing[1]) <= 1:
+                    continue
+                compared += 1
+                if fast != slow:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print("mismatch on ({}, {}):\n{}".format(i, j, state.board))
+
+    print("positions {}  squares compared {}  mismatches {}".format(len(positions), compared, mismatches))
+    queries = 64 * len(positions)
+    print("rays       {:8.2f}us per query".format(fastTime / queries * 1e6))
+    print("generation {:8.2f}us per query  ({:.0f}x slower)".format(
+        slowTime / queries * 1e6, slowTime / fastTime))
+
+
+def bench_perft(args):
+    """Runs perft on the standard positions, checking the node counts and reporting nodes per second. """
+    if args.fen:
+        # divide mode: per-move counts of a single position, for tracking down a wrong count
+        state = engine.State.from_fen(args.fen, args.backend)
+        counts = state.divide(args.depth)
+        for move, nodes in sorted(counts.items()):
+            print("{}: {}".format(move, nodes))
+        print("moves {}  nodes {}".format(len(counts), sum(counts.values())))
+        return
+
+    failures = 0
+    totalNodes = totalTime = 0
+    for name, fen, expected in PERFT_POSITIONS:
+        state = engine.State.from_fen(fen, args.backend)
+        depth = min(args.depth, len(expected))
+        start = time.perf_counter()
+        nodes = state.perft(depth)
+        elapsed = time.perf_counter() - start
+        totalNodes += nodes
+        totalTime += elapsed
+
+        result = "ok" if nodes == expected[depth - 1] else "FAIL (expected {})".format(expected[depth - 1])
+        failures += nodes != expected[depth - 1]
+        print("{:<32} depth {}  nodes {:>8}  nps {:>8.0f}  {}".format(
+            name, depth, nodes, nodes / elapsed, result))
+
+    print("{} failures, {} nodes in {:.2f}s ({:.0f} nps)".format(
+        failures, totalNodes, totalTime, totalNodes / totalTime))
+
+
+def bench_evaluation(args):
+    """
+    Checks that the incrementally kept material matches get_board_score on random positions,
+    and compares the cost of a leaf evaluation with get_board_score and get_incremental_score.
+    """
+    positions = list(random_positions(args.positions, args.seed))
+    mismatches = sum(state.material != move_finder.get_board_score(state)
+                     for state in positions if not state.checkmate and not state.stalemate)
+    print("positions {}  material mismatches {}".format(len(positions), mismatches))
+
+    for scoreFunction in (move_finder.get_board_score, move_finder.get_incremental_score):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for state in positions:
+                scoreFunction(state)
+        elapsed = time.perf_counter() - start
+        print("{:<22} {:8.2f}us per evaluation".format(
+            scoreFunction.__name__, elapsed / (args.repeat * len(positions)) * 1e6))
+
+
+def bench_batch(args):
+    """
+    Checks evaluation.evaluate_batch against evaluate_board on random positions (in both encodings),
+    and compares scoring them all in one batch with calling get_board_score and evaluate_board in a loop.
+    """
+    positions = list(random_positions(args.positions, args.seed))
+    squares = evaluation.encode_squares(positions)
+    planes = evaluation.encode_planes(positions)
+    expected = np.array([evaluation.evaluate_board(state.board) for state in positions]).T
+    for name, encoded in (("squares", squares), ("planes", planes)):
+        mismatches = (np.array(evaluation.evaluate_batch(encoded)) != expected).any(axis=0).sum()
+        print("{:<8} positions {}  mismatches {}".format(name, len(positions), mismatches))
+
+    def loop(scoreFunction):
+        for state in positions:
+            scoreFunction(state)
+
+    timings = [
+        ("get_board_score loop", lambda: loop(move_finder.get_board_score)),
+        ("evaluate_board loop", lambda: loop(lambda state: evaluation.evaluate_board(state.board))),
+        ("encode_squares", lambda: evaluation.encode_squares(positions)),
+        ("encode_planes", lambda: evaluation.encode_planes(positions)),
+        ("score_batch (squares)", lambda: evaluation.score_batch(squares)),
+        ("score_batch (planes)", lambda: evaluation.score_batch(planes)),
+    ]
+    for name, function in timings:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            function()
+        elapsed = time.perf_counter() - start
+        print("{:<22} {:8.2f}us per position".format(name, elapsed / (args.repeat * len(positions)) * 1e6))
+
+
+def bench_startup(args):
+    """
+    Times cold starts in fresh processes: importing the engine modules, cli.py up to its first move,
+    and importing the GUI (main.py, which pulls in pygame) for comparison.
+    Each is the best of `repeat` runs, as the first runs also pay for reading the files from disk.
+    """
+    commands = [
+        ("python (empty)", [sys.executable, "-c", "pass"]),
+        ("import engine", [sys.executable, "-c", "import engine"]),
+        ("import move_finder", [sys.executable, "-c", "import move_finder"]),
+        ("cli.py first move", [sys.executable, "cli.py", "--depth", str(args.depth)]),
+        ("import main (GUI)", [sys.executable, "-c", "import main"]),
+    ]
+    for name, command in commands:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            times.append(time.perf_counter() - start)
+            if result.returncode:
+                break
+        if result.returncode:
+            print("{:<22} failed: {}".format(name, result.stderr.decode().strip().splitlines()[-1]))
+        else:
+            print("{:<22} {:8.1f}ms".format(name, min(times) * 1000))
+
+
+def random_games(count, seed, plies):
+    """Returns `count` games of random moves from the start position, as lists of moves in UCI notation. """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        state = engine.State()
+        game = []
+        for _ in range(plies):
+            validMoves = state.get_valid_moves()
+            if not validMoves:
+                break
+            move = rng.choice(validMoves)
+            game.append(move.get_uci_notation())
+            state.make_move(move)
+        games.append(game)
+    return games
+
+
+def bench_book(args):
+    """
+    Builds an opening book from random games, then times opening it and looking positions up (found or not),
+    against searching the same positions.
+    """
+    games = random_games(args.games, args.seed, args.plies)
+    path = os.path.join(tempfile.mkdtemp(), "book.bin")
+    start = time.perf_counter()
+    entries = book.build_book(games, path, args.plies)
+    print("built {} entries ({} KB) from {} games in {:.2f}s".format(
+        entries, os.path.getsize(path) // 1024, len(games), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    openingBook = book.OpeningBook(path)
+    print("opened in {:.3f}ms".format((time.perf_counter() - start) * 1000))
+
+    # positions along the first games (at every ply in turn) are in the book,
+    # random positions further into a game mostly are not
+    inBook = []
+    for game in games[:args.positions]:
+        state = engine.State()
+        for uciMove in game[:len(inBook) % len(game)]:
+            state.make_move(next(move for move in state.get_valid_moves() if move.get_uci_notation() == uciMove))
+        inBook.append(state)
+    outOfBook = list(random_positions(args.positions, args.seed + 1, maxPlies=args.plies * 2))
+
+    for name, positions in (("in book", inBook), ("out of book", outOfBook)):
+        validMoves = [state.get_valid_moves() for state in positions]
+        start = time.perf_counter()
+        found = sum(openingBook.choose_move(state, moves) is not None for state, moves in zip(positions, validMoves))
+        elapsed = time.perf_counter() - start
+        print("{:<12} {:5} positions  found {:5}  {:8.2f}us per lookup".format(
+            name, len(positions), found, elapsed / len(positions) * 1e6))
+
+    start = time.perf_counter()
+    for state in inBook[:10]:
+        move_finder.get_best_move_alpha_beta(state, state.get_valid_moves(), args.depth)
+    print("search depth {}        {:8.0f}us per position".format(args.depth, (time.perf_counter() - start) / 10 * 1e6))
+    openingBook.close()
+
+
+def write_random_pgn(path, count, seed, maxPlies):
+    """Writes `count` games of random moves to a PGN file, one game at a time. """
+    rng = random.Random(seed)
+    with open(path, "w") as pgnFile:
+        for number in range(1, count + 1):
+            state = engine.State()
+            movetext = []
+            for ply in range(rng.randint(1, maxPlies)):
+                validMoves = state.get_valid_moves()
+                if not validMoves:
+                    break
+                move = rng.choice(validMoves)
+                if ply % 2 == 0:
+                    movetext.append("{}.".format(ply // 2 + 1))
+                movetext.append(pgn.get_san(state, move, validMoves))
+                state.make_move(move)
+            pgnFile.write('[Event "random game {}"]\n[Result "*"]\n\n{} *\n\n'.format(number, " ".join(movetext)))
+
+
+def bench_pgn(args):
+    """
+    Replays PGN files (random games written to a temporary directory, unless files are given) in this process
+    and across worker processes, reporting games and positions per second and the peak memory use.
+    """
+    if args.pgn:
+        paths = args.pgn
+    else:
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, "games{}.pgn".format(index)) for index in range(args.files)]
+        write_random_pgn(paths[0], args.games, args.seed, args.plies)
+        for path in paths[1:]:
+            shutil.copyfile(paths[0], path)
+    size = sum(os.path.getsize(path) for path in paths)
+    print("{} files, {:.1f} MB".format(len(paths), size / 1024 ** 2))
+
+    for workers in (1, args.workers or os.cpu_count()):
+        start = time.perf_counter()
+        counts = pgn.replay_files(paths, workers)
+        elapsed = time.perf_counter() - start
+        print("{:>2} workers  {} games  {} positions  {} errors  {:7.0f} games/s  {:8.0f} positions/s".format(
+            workers, counts["games"], counts["plies"], counts["errors"],
+            counts["games"] / elapsed, counts["plies"] / elapsed))
+    # peak resident set size (in KB on Linux) of this process, and of the largest worker process
+    print("peak RSS  main {:.0f} MB  worker {:.0f} MB".format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024))
+
+
+def bench_ordering(args):
+    """
+    Compares the search with and without killer moves and the history table (move_finder.MoveOrdering),
+    in nodes, time and the fraction of cutoffs made by the first move searched, on the perft positions.
+    """
+    for name, fen, _ in PERFT_POSITIONS[:6]:
+        print(name)
+        for label, ordering in (("mvv-lva only", False), ("killers + history", None)):
+            state = engine.State.from_fen(fen)
+            random.seed(args.seed)  # the same shuffle of the root moves for both
+            search = move_finder.AlphaBetaSearch(args.depth, transposition.TranspositionTable(), ordering=ordering)
+            start = time.perf_counter()
+            search.iterate(state, state.get_valid_moves())
+            elapsed = time.perf_counter() - start
+            print("  {:<18} depth {}  nodes {:>8}  time {:6.2f}s  first move cutoffs {:.1%} of {}".format(
+                label, args.depth, search.nodes, elapsed,
+                search.firstMoveCutoffs / search.cutoffs if search.cutoffs else 0, search.cutoffs))
+
+
+def bench_selective(args):
+    """
+    Compares the search with each selective feature (see move_finder.SearchConfig) alone, all and none of them:
+    in nodes and time to the same depth on the perft positions, and in tactics found at every depth up to it.
+    """
+    for name, fen, _ in PERFT_POSITIONS[:6]:
+        print(name)
+        for label, config in SEARCH_CONFIGS:
+            state = engine.State.from_fen(fen)
+            random.seed(args.seed)  # the same shuffle of the root moves for all
+            search = move_finder.AlphaBetaSearch(args.depth, transposition.TranspositionTable(), config=config)
+            start = time.perf_counter()
+            move = search.iterate(state, state.get_valid_moves())
+            elapsed = time.perf_counter() - start
+            print("  {:<21} depth {}  nodes {:>8}  time {:6.2f}s  move {}  score {:.2f}".format(
+                label, args.depth, search.nodes, elapsed, move.get_uci_notation(), search.score))
+
+    print("tactics found (of {}) by depth".format(len(TACTICS)))
+    for label, config in SEARCH_CONFIGS:
+        found = []
+        for depth in range(1, args.depth + 1):
+            count = 0
+            for _, fen, bestMove in TACTICS:
+                state = engine.State.from_fen(fen)
+                random.seed(args.seed)
+                search = move_finder.AlphaBetaSearch(depth, transposition.TranspositionTable(), config=config)
+                count += search.iterate(state, state.get_valid_moves()).get_uci_notation() == bestMove
+            found.append(count)
+        print("  {:<21} {}".format(label, "  ".join("{}: {}".format(depth + 1, count)
+                                                  for depth, count in enumerate(found))))
+
+
+class DictMove():
+    """
+    Move without __slots__, its attributes kept in a per-instance __dict__ as they were before Move had slots
+    (otherwise the same class), which bench_allocations swaps in for Move to measure what the slots save.
+    """
+    __init__ = engine.Move.__init__
+    get_uci_notation = engine.Move.get_uci_notation
+    __eq__ = engine.Move.__eq__
+    __hash__ = engine.Move.__hash__
+
+
+def measure_allocations(state, depth, moveClass):
+    """
+    Runs perft with engine.Move swapped for moveClass (both backends build their moves through it), and returns
+    (bytes per Move, Moves built, leaf nodes, peak traced bytes of the run, best untraced seconds).
+    """
+    original = engine.Move
+    built = [0]
+
+    class CountedMove(moveClass):
+        __slots__ = ()
+
+        def __init__(self, *args, **kwargs):
+            built[0] += 1
+            super().__init__(*args, **kwargs)
+
+    try:
+        engine.Move = moveClass
+        # memory of one move, traced over many of them (the list holding them is allocated beforehand)
+        board = state.get_board_rows()
+        moves = [None] * 10000
+        tracemalloc.start()
+        for index in range(len(moves)):
+            moves[index] = moveClass((6, 4), (4, 4), board)
+        moveBytes = tracemalloc.get_traced_memory()[0] / len(moves)
+        del moves
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        nodes = state.perft(depth)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        elapsed = float("inf")
+        for _ in range(3):  # best of three, as timings are noisy
+            start = time.perf_counter()
+            state.perft(depth)
+            elapsed = min(elapsed, time.perf_counter() - start)
+
+        engine.Move = CountedMove
+        state.perft(depth)
+    finally:
+        engine.Move = original
+    return moveBytes, built[0], nodes, peak, elapsed
+
+
+def bench_allocations(args):
+    """
+    Measures what a perft run allocates, with Move as it is (__slots__) and as it was before (a __dict__ per move):
+    the memory of one Move, how many are built per leaf node and the bytes they take, the peak memory
+    traced by tracemalloc while the moves of every ply are alive, and the (untraced) speed.
+    """
+    state = engine.State.from_fen(PERFT_POSITIONS[1][1], args.backend)  # kiwipete
+    print("kiwipete  depth {}".format(args.depth))
+    for label, moveClass in (("__slots__", engine.Move), ("__dict__", DictMove)):
+        moveBytes, built, nodes, peak, elapsed = measure_allocations(state, args.depth, moveClass)
+        print("  {:<9}  {:5.0f} bytes per Move  {:4.2f} Moves per node  {:6.1f} bytes of Moves per node  "
+              "peak traced {:7.1f} KB  {:>7.0f} nps".format(
+                  label, moveBytes, built / nodes, moveBytes * built / nodes, peak / 1024, nodes / elapsed))
+
+
+def bench_parallel(args):
+    """Compares the single process alpha-beta search with the root-parallel search for several worker counts. """
+    state = engine.State(backend=args.backend)
+    play_opening(state, ITALIAN_GAME)
+
+    start = time.perf_counter()
+    _, nodes = move_finder.get_best_move_alpha_beta(state, state.get_valid_moves(), args.depth)
+    single = time.perf_counter() - start
+    print("single process  depth {}  nodes {:>8}  time {:7.2f}s".format(args.depth, nodes, single))
+
+    for workers in args.workers:
+        # start the processes before timing, as a long running caller would keep its pool
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(abs, range(workers)))
+            start = time.perf_counter()
+            _, nodes = move_finder.get_best_move_parallel(
+                state, state.get_valid_moves(), args.depth, workers, executor)
+            elapsed = time.perf_counter() - start
+        print("{:>2} workers      depth {}  nodes {:>8}  time {:7.2f}s  speedup {:.2f}x".format(
+            workers, args.depth, nodes, elapsed, single / elapsed))
+
+
+def bench_quiescence(args):
+    """
+    Compares a search of the tactics at a given depth with and without the quiescence search,
+    and without it one ply deeper, in nodes, time and moves found.
+    """
+    for name, fen, bestMove in TACTICS:
+        print(name)
+        for depth, quiescence in ((args.depth, False), (args.depth, True), (args.depth + 1, False)):
+            state = engine.State.from_fen(fen, args.backend)
+            search = move_finder.AlphaBetaSearch(depth, quiescence=quiescence)
+            start = time.perf_counter()
+            move = search.search(state, state.get_valid_moves())
+            elapsed = time.perf_counter() - start
+            print("  depth {} {:<15} nodes {:>7}  time {:6.3f}s  move {} {}".format(
+                depth, "quiescence" if quiescence else "no quiescence", search.nodes, elapsed,
+                move.get_uci_notation(), "ok" if move.get_uci_notation() == bestMove else "(best " + bestMove + ")"))
+
+
+def bench_staged(args):
+    """
+    Counts how often the alpha-beta search needs the quiet moves of a position, which the staged
+    move generation only builds once the hash move and the captures did not cause a cutoff.
+    """
+    state = engine.State(backend=args.backend)
+    play_opening(state, ITALIAN_GAME)
+    stageCounts = {"get_valid_captures": 0, "get_valid_quiet_moves": 0}
+
+    def counted(name):
+        generate = getattr(state, name)
+
+        def count(moves=None, **options):
+            stageCounts[name] += 1
+            return generate(moves, **options)
+        return count
+
+    for name in stageCounts:
+        setattr(state, name, counted(name))
+    search = move_finder.AlphaBetaSearch(args.depth, quiescence=False)
+    start = time.perf_counter()
+    search.search(state, state.get_valid_moves())
+    elapsed = time.perf_counter() - start
+    # without the quiescence search, captures are only generated by the staged moves of interior nodes
+    interior = stageCounts["get_valid_captures"]
+    print("depth {}  nodes {}  time {:.2f}s  interior nodes {}  quiet moves generated at {} ({:.1%})".format(
+        args.depth, search.nodes, elapsed, interior, stageCounts["get_valid_quiet_moves"],
+        stageCounts["get_valid_quiet_moves"] / interior))
+
+
+def bench_cache(args):
+    """
+    Times get_valid_moves with and without a move cache while a game is replayed back and forth
+    (like undo and redo in the GUI), then perft with a cache small enough to evict entries.
+    """
+    for capacity in (None, args.capacity):
+        state = engine.State(backend=args.backend)
+        if capacity is not None:
+            state.moveCache = move_cache.MoveCache(capacity)
+        moves = [move for _, move in zip(range(args.plies), replay_game(args.seed, args.backend))]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for move in moves:
+                state.get_valid_moves()
+                state.make_move(move)
+            for _ in moves:
+                state.undo_move()
+                state.get_valid_moves()
+        elapsed = time.perf_counter() - start
+        calls = args.repeat * 2 * len(moves)
+        print("{:<10} {:8.1f}us per get_valid_moves  {}".format(
+            "cache" if capacity else "no cache", elapsed / calls * 1e6,
+            state.moveCache.stats() if capacity else ""))
+
+    # from the start position, where many move orders transpose into the same positions
+    state = engine.State(backend=args.backend)
+    state.moveCache = move_cache.MoveCache(args.capacity)
+    start = time.perf_counter()
+    nodes = state.perft(args.depth)
+    elapsed = time.perf_counter() - start
+    print("perft depth {}  nodes {}  time {:.2f}s  {}".format(args.depth, nodes, elapsed, state.moveCache.stats()))
+
+
+def replay_game(seed, backend):
+    """Yields the moves of a random game (the same one for the same seed). """
+    rng = random.Random(seed)
+    state = engine.State(backend=backend)
+    validMoves = state.get_valid_moves()
+    while validMoves:
+        move = rng.choice(validMoves)
+        yield move
+        state.make_move(move)
+        validMoves = state.get_valid_moves()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Engine benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    backends = subparsers.add_parser(
+        "backends", help="nodes/second of the array and bitboard State backends")
+    backends.add_argument("--depth", type=int, default=3)
+    backends.set_defaults(run=bench_backends)
+
+    perft = subparsers.add_parser(
+        "perft", help="move generator correctness and speed on the standard perft positions")
+    perft.add_argument("--depth", type=int, default=3)
+    perft.add_argument("--backend", default="array")
+    perft.add_argument("--fen", help="print per-move counts (divide) for this position instead")
+    perft.set_defaults(run=bench_perft)
+
+    evaluationParser = subparsers.add_parser(
+        "evaluation", help="full-board against incremental evaluation, for correctness and speed")
+    evaluationParser.add_argument("--positions", type=int, default=500)
+    evaluationParser.add_argument("--repeat", type=int, default=20)
+    evaluationParser.add_argument("--seed", type=int, default=1)
+    evaluationParser.set_defaults(run=bench_evaluation)
+
+    batch = subparsers.add_parser(
+        "batch", help="vectorised batch evaluation against evaluating positions one at a time")
+    batch.add_argument("--positions", type=int, default=5000)
+    batch.add_argument("--repeat", type=int, default=5)
+    batch.add_argument("--seed", type=int, default=1)
+    batch.set_defaults(run=bench_batch)
+
+    startup = subparsers.add_parser(
+        "startup", help="cold start time of the headless cli.py to its first move, against importing the GUI")
+    startup.add_argument("--depth", type=int, default=2)
+    startup.add_argument("--repeat", type=int, default=10)
+    startup.set_defaults(run=bench_startup)
+
+    bookParser = subparsers.add_parser(
+        "book", help="build an opening book from random games and time its lookups against a search")
+    bookParser.add_argument("--games", type=int, default=5000)
+    bookParser.add_argument("--plies", type=int, default=book.BOOK_PLIES)
+    bookParser.add_argument("--positions", type=int, default=1000)
+    bookParser.add_argument("--depth", type=int, default=3)
+    bookParser.add_argument("--seed", type=int, default=1)
+    bookParser.set_defaults(run=bench_book)
+
+    pgnParser = subparsers.add_parser(
+        "pgn", help="games per second and peak memory of replaying PGN files, in one and several processes")
+    pgnParser.add_argument("pgn", nargs="*", help="PGN files to replay (random games are generated if none)")
+    pgnParser.add_argument("--games", type=int, default=1000)
+    pgnParser.add_argument("--plies", type=int, default=120)
+    pgnParser.add_argument("--files", type=int, default=4)
+    pgnParser.add_argument("--workers", type=int)
+    pgnParser.add_argument("--seed", type=int, default=1)
+    pgnParser.set_defaults(run=bench_pgn)
+
+    ordering = subparsers.add_parser(
+        "ordering", help="search with and without killer moves and the history table")
+    ordering.add_argument("--depth", type=int, default=4)
+    ordering.add_argument("--seed", type=int, default=1)
+    ordering.set_defaults(run=bench_ordering)
+
+    selective = subparsers.add_parser(
+        "selective", help="search with and without null-move pruning, late move reductions and futility pruning")
+    selective.add_argument("--depth", type=int, default=5)
+    selective.add_argument("--seed", type=int, default=1)
+    selective.set_defaults(run=bench_selective)
+
+    allocations = subparsers.add_parser(
+        "allocations", help="Move size, memory and speed of a perft run")
+    allocations.add_argument("--depth", type=int, default=3)
+    allocations.add_argument("--backend", default="array")
+    allocations.set_defaults(run=bench_allocations)
+
+    parallel = subparsers.add_parser(
+        "parallel", help="single process against root-parallel alpha-beta search")
+    parallel.add_argument("--depth", type=int, default=4)
+    parallel.add_argument("--workers", type=int, nargs="+",
+                          default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parallel.add_argument("--backend", default="array")
+    parallel.set_defaults(run=bench_parallel)
+
+    quiescence = subparsers.add_parser(
+        "quiescence", help="tactics searched with and without the quiescence search, and one ply deeper")
+    quiescence.add_argument("--depth", type=int, default=2)
+    quiescence.add_argument("--backend", default="array")
+    quiescence.set_defaults(run=bench_quiescence)
+
+    cache = subparsers.add_parser(
+        "cache", help="get_valid_moves with and without the move cache, replaying a game back and forth")
+    cache.add_argument("--capacity", type=int, default=4096)
+    cache.add_argument("--plies", type=int, default=60)
+    cache.add_argument("--repeat", type=int, default=20)
+    cache.add_argument("--depth", type=int, default=4)
+    cache.add_argument("--seed", type=int, default=1)
+    cache.add_argument("--backend", default="array")
+    cache.set_defaults(run=bench_cache)
+
+    staged = subparsers.add_parser(
+        "staged", help="how often the search needs to generate quiet moves")
+    staged.add_argument("--depth", type=int, default=4)
+    staged.add_argument("--backend", default="bitboard")
+    staged.set_defaults(run=bench_staged)
+
+    search = subparsers.add_parser(
+        "search", help="nodes and time of the min-max search against the alpha-beta search")
+    search.add_argument("--depth", type=int, default=4)
+    search.add_argument("--backend", default="array")
+    search.set_defaults(run=bench_search)
+
+    table = subparsers.add_parser(
+        "table", help="alpha-beta search with and without a transposition table")
+    table.add_argument("--depth", type=int, default=4)
+    table.add_argument("--size", type=int, default=16, help="table size in MB")
+    table.add_argument("--backend", default="array")
+    table.set_defaults(run=bench_table)
+
+    iterative = subparsers.add_parser(
+        "iterative", help="depth reached and latency of the iterative deepening search per time budget")
+    iterative.add_argument("--times", type=int, nargs="+", default=[100, 500, 2000], help="budgets in ms")
+    iterative.add_argument("--backend", default="array")
+    iterative.set_defaults(run=bench_iterative)
+
+    generators = subparsers.add_parser(
+        "generators", help="time of each move generator of the array backend per call")
+    generators.add_argument("--positions", type=int, default=500)
+    generators.add_argument("--repeat", type=int, default=20)
+    generators.add_argument("--seed", type=int, default=1)
+    generators.set_defaults(run=bench_generators)
+
+    attacks = subparsers.add_parser(
+        "attacks", help="check is_under_attack against move generation on random positions, and time both")
+    attacks.add_argument("--positions", type=int, default=2000)
+    attacks.add_argument("--seed", type=int, default=1)
+    attacks.set_defaults(run=bench_attacks)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
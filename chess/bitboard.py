@@ -0,0 +1,413 @@
+# the bitboard backend for the State class, keeping one 64-bit occupancy mask per piece type and colour
+#
+# A note on the square numbering used in this module:
+# - square index = row * 8 + col, using the same rows and cols as State.board (row 0 is black's back rank)
+# - bit n of a mask is set when square n is occupied
+# - moving "east" adds 1 to the index, moving "south" (toward white) adds 8
+import engine
+
+# every piece string used on the board, white first
+PIECE_TYPES = ["wP", "wN", "wB", "wR", "wQ", "wK",
+               "bP", "bN", "bB", "bR", "bQ", "bK"]
+
+# (row, col) tuple for every square index, used when building Move objects
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+
+# directions are (row step, col step, index step); the first four are orthogonal, the last four diagonal
+DIRECTIONS = [(-1, 0, -8), (0, 1, 1), (1, 0, 8), (0, -1, -1),
+              (-1, -1, -9), (-1, 1, -7), (1, 1, 9), (1, -1, 7)]
+
+
+def _build_rays():
+    """Builds, for every direction and square, the mask of squares from (not including) the square to the edge. """
+    rays = []
+    for x, y, _ in DIRECTIONS:
+        directionRays = []
+        for sq in range(64):
+            mask = 0
+            r, c = sq // 8 + x, sq % 8 + y
+            while -1 < r < 8 and -1 < c < 8:
+                mask |= 1 << (r * 8 + c)
+                r, c = r + x, c + y
+            directionRays.append(mask)
+        rays.append(directionRays)
+    return rays
+
+
+def _build_jumps(jumps):
+    """Builds the mask of squares reachable by a fixed set of jumps from every square. """
+    table = []
+    for sq in range(64):
+        mask = 0
+        for x, y in jumps:
+            r, c = sq // 8 + x, sq % 8 + y
+            if -1 < r < 8 and -1 < c < 8:
+                mask |= 1 << (r * 8 + c)
+        table.append(mask)
+    return table
+
+
+def _build_between():
+    """Builds the mask of squares strictly between every pair of squares on a shared line (0 if not aligned). """
+    between = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for d in range(8):
+            x, y, _ = DIRECTIONS[d]
+            mask = 0
+            r, c = sq // 8 + x, sq % 8 + y
+            while -1 < r < 8 and -1 < c < 8:
+                between[sq][r * 8 + c] = mask
+                mask |= 1 << (r * 8 + c)
+                r, c = r + x, c + y
+    return between
+
+
+RAYS = _build_rays()
+KNIGHT_ATTACKS = _build_jumps([(-2, 1), (-1, 2), (1, 2), (2, 1),
+                               (2, -1), (1, -2), (-1, -2), (-2, -1)])
+KING_ATTACKS = _build_jumps([(-1, -1), (-1, 0), (-1, 1), (0, 1),
+                             (1, 1), (1, 0), (1, -1), (0, -1)])
+# squares attacked BY a pawn of the given colour standing on each square
+PAWN_ATTACKS = {"w": _build_jumps([(-1, -1), (-1, 1)]),
+                "b": _build_jumps([(1, -1), (1, 1)])}
+BETWEEN = _build_between()
+
+# the index step of each direction is positive when the ray walks toward higher square indices,
+# which tells us whether the nearest blocker is the lowest or the highest set bit of the ray
+ORTHOGONAL = [(RAYS[d], DIRECTIONS[d][2] > 0) for d in range(4)]
+DIAGONAL = [(RAYS[d], DIRECTIONS[d][2] > 0) for d in range(4, 8)]
+
+RANK_3 = 0xFF << 40  # square a white pawn reaches after its first single push (row 5)
+RANK_6 = 0xFF << 16  # square a black pawn reaches after its first single push (row 2)
+RANK_8 = 0xFF  # row 0, where white pawns promote
+RANK_1 = 0xFF << 56  # row 7, where black pawns promote
+FULL = (1 << 64) - 1
+
+# the kinds of moves BitboardState.generate_moves can be asked for
+ALL_MOVES = "all"
+CAPTURES = "captures"
+QUIET_MOVES = "quiet"
+
+
+def slider_attacks(sq, occupied, rays):
+    """Returns the mask of squares a slider on sq attacks along the given rays, stopping at the first blocker. """
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            # nearest blocker is the lowest set bit on positive rays and the highest on negative ones
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            # remove everything behind the blocker (the blocker itself stays attacked)
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def iterate_bits(mask):
+    """Yields the index of every set bit in the mask, lowest first. """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitboardState(engine.State):
+    """
+    A State that keeps an occupancy mask per piece alongside the board, so that move generation
+    becomes mask arithmetic instead of per-square string comparisons.
+    The board itself is kept as plain nested lists (instead of a NumPy array) since the only
+    remaining per-square accesses are single reads and writes, which are much cheaper on lists.
+    """
+
+    def __init__(self, backend="bitboard"):
+        super().__init__(backend)
+        self.board = [[str(piece) for piece in row] for row in self.board]
+        self.sync_masks()
+
+    def load_fen(self, fen):
+        """Sets up the position described by a FEN string (see State.load_fen), then rebuilds the masks. """
+        super().load_fen(fen)
+        self.board = [[str(piece) for piece in row] for row in self.board]
+        self.sync_masks()
+
+    def sync_masks(self):
+        """Rebuilds every mask from the board; only needed when the board is set wholesale. """
+        self.masks = {piece: 0 for piece in PIECE_TYPES}
+        for sq in range(64):
+            piece = self.board[sq // 8][sq % 8]
+            if piece:
+                self.masks[piece] |= 1 << sq
+
+    def make_move(self, move):
+        """Makes the move on the board (see State.make_move), then mirrors it onto the masks. """
+        super().make_move(move)
+        masks = self.masks
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+
+        masks[move.pieceMoved] ^= 1 << startSq
+        if move.isEnPassantMove:
+            masks[move.pieceCaptured] ^= 1 << (move.startRow * 8 + move.endCol)
+        elif move.pieceCaptured:
+            masks[move.pieceCaptured] ^= 1 << endSq
+        # the piece standing on the end square may differ from the one that moved (promotion)
+        masks[self.board[move.endRow][move.endCol]] ^= 1 << endSq
+
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2:
+                masks[rook] ^= (1 << (endSq + 1)) | (1 << (endSq - 1))
+            else:
+                masks[rook] ^= (1 << (endSq - 2)) | (1 << (endSq + 1))
+
+    def undo_move(self):
+        """Undoes the last move on the board (see State.undo_move), then mirrors it onto the masks. """
+        if not self.log:
+            return
+        move = self.log[-1]
+        masks = self.masks
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+
+        # read what is on the end square before the board is restored (promotion)
+        masks[self.board[move.endRow][move.endCol]] ^= 1 << endSq
+        super().undo_move()
+
+        masks[move.pieceMoved] ^= 1 << startSq
+        if move.isEnPassantMove:
+            masks[move.pieceCaptured] ^= 1 << (move.startRow * 8 + move.endCol)
+        elif move.pieceCaptured:
+            masks[move.pieceCaptured] ^= 1 << endSq
+
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2:
+                masks[rook] ^= (1 << (endSq + 1)) | (1 << (endSq - 1))
+            else:
+                masks[rook] ^= (1 << (endSq - 2)) | (1 << (endSq + 1))
+
+    def occupancy(self, color):
+        """Returns the mask of all squares occupied by the given colour ("w" or "b"). """
+        masks = self.masks
+        return masks[color + "P"] | masks[color + "N"] | masks[color + "B"] | \
+            masks[color + "R"] | masks[color + "Q"] | masks[color + "K"]
+
+    def attackers_to(self, sq, color, occupied):
+        """Returns the mask of pieces of the given colour attacking sq, with sliders blocked by `occupied`. """
+        masks = self.masks
+        enemyColor = "b" if color == "w" else "w"
+        # a square is attacked by a pawn of `color` if a pawn of the other colour standing there would attack it back
+        attackers = PAWN_ATTACKS[enemyColor][sq] & masks[color + "P"]
+        attackers |= KNIGHT_ATTACKS[sq] & masks[color + "N"]
+        attackers |= KING_ATTACKS[sq] & masks[color + "K"]
+        queens = masks[color + "Q"]
+        attackers |= slider_attacks(sq, occupied, ORTHOGONAL) & (masks[color + "R"] | queens)
+        attackers |= slider_attacks(sq, occupied, DIAGONAL) & (masks[color + "B"] | queens)
+        return attackers
+
+    def is_under_attack(self, i, j):
+        """ Determine if a specific square is under attack by the opponent of the side to move. """
+        enemyColor = "b" if self.whiteToMove else "w"
+        occupied = self.occupancy("w") | self.occupancy("b")
+        return self.attackers_to(i * 8 + j, enemyColor, occupied) != 0
+
+    def generate_valid_moves(self, moves=None):
+        """
+        Generates valid moves only, using pin and check masks instead of simulating moves
+        (State.get_valid_moves calls this when the move cache can not answer the position).
+        """
+        return self.generate_moves(moves, ALL_MOVES)
+
+    def get_valid_captures(self, moves=None):
+        """Generates the valid captures and promotions only (see State.get_valid_captures). """
+        return self.generate_moves(moves, CAPTURES)
+
+    def get_legality_masks(self):
+        """The bitboard generators work their masks out as they go, so there is nothing to hand on. """
+        return None
+
+    def get_valid_quiet_moves(self, moves=None, masks=None):
+        """Generates the valid moves that neither capture nor promote (see State.get_valid_quiet_moves). """
+        return self.generate_moves(moves, QUIET_MOVES)
+
+    def generate_moves(self, moves, kind):
+        """
+        Generates the valid moves of the side to move of the given kind: ALL_MOVES, CAPTURES (captures and
+        promotions, or every valid move when in check) or QUIET_MOVES (the rest). Only the wanted moves are built,
+        by limiting the target squares to enemy pieces or to empty squares.
+        """
+        masks = self.masks
+        board = self.board
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        own = self.occupancy(allyColor)
+        enemy = self.occupancy(enemyColor)
+        occupied = own | enemy
+
+        kingSq = masks[allyColor + "K"].bit_length() - 1
+        checkers = self.attackers_to(kingSq, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        if kind == CAPTURES and checkers:
+            kind = ALL_MOVES
+        # squares the pieces may move to, apart from the check and pin restrictions below
+        if kind == CAPTURES:
+            reachable = enemy
+        elif kind == QUIET_MOVES:
+            reachable = ~occupied & FULL
+        else:
+            reachable = ~own & FULL
+
+        # king moves: the king may go to any square not attacked once it has left its current square
+        # (otherwise a slider checking along a line would appear blocked by the king itself)
+        withoutKing = occupied ^ (1 << kingSq)
+        kingFrom = SQUARES[kingSq]
+        for sq in iterate_bits(KING_ATTACKS[kingSq] & reachable):
+            if not self.attackers_to(sq, enemyColor, withoutKing):
+                moves.append(engine.Move(kingFrom, SQUARES[sq], board))
+
+        # in a double check only the king can move
+        if checkers & (checkers - 1):
+            if kind == ALL_MOVES:
+                self.checkmate = not moves
+                self.stalemate = False
+            return moves
+
+        # squares a non-king piece must move to: anywhere if not in check, otherwise block or capture the checker
+        if checkers:
+            checkerSq = checkers.bit_length() - 1
+            checkMask = BETWEEN[kingSq][checkerSq] | checkers
+        else:
+            checkMask = FULL
+
+        # pinned pieces may only move along the line between the king and the pinning piece
+        pinMasks = {}
+        enemyQueens = masks[enemyColor + "Q"]
+        for rays, snipers in ((ORTHOGONAL, masks[enemyColor + "R"] | enemyQueens),
+                              (DIAGONAL, masks[enemyColor + "B"] | enemyQueens)):
+            # looking from the king through our own pieces, any slider we hit is a potential pinner
+            for sniperSq in iterate_bits(slider_attacks(kingSq, enemy, rays) & snipers):
+                blockers = BETWEEN[kingSq][sniperSq] & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & own:
+                    pinMasks[blockers.bit_length() - 1] = BETWEEN[kingSq][sniperSq] | (1 << sniperSq)
+
+        targets = reachable & checkMask
+        # knights (a pinned knight can never move)
+        for sq in iterate_bits(masks[allyColor + "N"]):
+            if sq in pinMasks:
+                continue
+            start = SQUARES[sq]
+            for end in iterate_bits(KNIGHT_ATTACKS[sq] & targets):
+                moves.append(engine.Move(start, SQUARES[end], board))
+
+        # sliders
+        for piece, rays in (("B", DIAGONAL), ("R", ORTHOGONAL), ("Q", ORTHOGONAL + DIAGONAL)):
+            for sq in iterate_bits(masks[allyColor + piece]):
+                attacks = slider_attacks(sq, occupied, rays) & targets & pinMasks.get(sq, FULL)
+                start = SQUARES[sq]
+                for end in iterate_bits(attacks):
+                    moves.append(engine.Move(start, SQUARES[end], board))
+
+        # pawns
+        self.get_pawn_bitboard_moves(moves, allyColor, enemy, occupied, checkMask, pinMasks, kingSq, kind)
+
+        # castling, only when not in check
+        if not checkers and kind != CAPTURES:
+            self.get_castling_bitboard_moves(moves, allyColor, enemyColor, occupied, kingSq)
+
+        if kind != ALL_MOVES:
+            # checkmate and stalemate can not be told from part of the moves (see State.get_valid_captures)
+            self.checkmate = False
+            self.stalemate = False
+            return moves
+
+        self.checkmate = not moves and self.inCheck
+        self.stalemate = not moves and not self.inCheck
+
+        return moves
+
+    def get_pawn_bitboard_moves(self, moves, allyColor, enemy, occupied, checkMask, pinMasks, kingSq,
+                                kind=ALL_MOVES):
+        """
+        Adds the legal pawn moves (pushes, captures and en passant) of the side to move,
+        or only the captures and promotions (kind CAPTURES) or only the other pushes (kind QUIET_MOVES).
+        """
+        board = self.board
+        pawns = self.masks[allyColor + "P"]
+        empty = ~occupied & FULL
+        # forward step in square indices, and the rank a single push lands on before a double push is allowed
+        step = -8 if allyColor == "w" else 8
+        doubleRank = RANK_3 if allyColor == "w" else RANK_6
+        # the rank a push promotes on
+        lastRank = RANK_8 if allyColor == "w" else RANK_1
+
+        for sq in iterate_bits(pawns):
+            allowed = checkMask & pinMasks.get(sq, FULL)
+            start = SQUARES[sq]
+
+            oneStep = sq + step
+            if empty >> oneStep & 1:
+                # a push to the last rank is a promotion, which counts as a capture
+                promotes = lastRank >> oneStep & 1 == 1
+                if allowed >> oneStep & 1 and (kind == ALL_MOVES or (kind == CAPTURES) == promotes):
+                    self.add_pawn_move(start, SQUARES[oneStep], moves)
+                twoStep = oneStep + step
+                if kind != CAPTURES and doubleRank >> oneStep & 1 and empty >> twoStep & 1 and \
+                        allowed >> twoStep & 1:
+                    moves.append(engine.Move(start, SQUARES[twoStep], board))
+
+            if kind == QUIET_MOVES:
+                continue
+            for end in iterate_bits(PAWN_ATTACKS[allyColor][sq] & enemy & allowed):
+                self.add_pawn_move(start, SQUARES[end], moves)
+
+        if kind == QUIET_MOVES:
+            return
+
+        # en passant is checked by replaying the capture on the occupancy mask, which also catches
+        # the rare case of both pawns leaving the king's rank and exposing it to a rook or queen
+        if self.enPassantSquare:
+            epSq = self.enPassantSquare[0] * 8 + self.enPassantSquare[1]
+            capturedSq = epSq - step
+            enemyColor = "b" if allyColor == "w" else "w"
+            enemyPawn = enemyColor + "P"
+            if not self.masks[enemyPawn] >> capturedSq & 1:
+                return
+            # pawns of ours that attack the en passant square are the ones a pawn of theirs there would attack
+            for sq in iterate_bits(PAWN_ATTACKS[enemyColor][epSq] & pawns):
+                afterOccupied = (occupied ^ (1 << sq) ^ (1 << capturedSq)) | (1 << epSq)
+                self.masks[enemyPawn] ^= 1 << capturedSq
+                exposed = self.attackers_to(kingSq, enemyColor, afterOccupied)
+                self.masks[enemyPawn] ^= 1 << capturedSq
+                if not exposed:
+                    moves.append(engine.Move(SQUARES[sq], SQUARES[epSq], board, isEnPassantMove=True))
+
+    def get_castling_bitboard_moves(self, moves, allyColor, enemyColor, occupied, kingSq):
+        """Adds castling moves: rights held, rook in place, path empty and not crossing attacked squares. """
+        rights = self.currentCastlingRights
+        # the rights are only ever held while the king stands on its starting square
+        if kingSq != (60 if allyColor == "w" else 4):
+            return
+        rooks = self.masks[allyColor + "R"]
+        if allyColor == "w":
+            kingSide, queenSide = rights.whiteKingSide, rights.whiteQueenSide
+        else:
+            kingSide, queenSide = rights.blackKingSide, rights.blackQueenSide
+
+        if kingSide and rooks >> (kingSq + 3) & 1 and not occupied & (0b11 << (kingSq + 1)):
+            if not self.attackers_to(kingSq + 1, enemyColor, occupied) and \
+                    not self.attackers_to(kingSq + 2, enemyColor, occupied):
+                moves.append(engine.Move(SQUARES[kingSq], SQUARES[kingSq + 2], self.board, isCastleMove=True))
+
+        if queenSide and rooks >> (kingSq - 4) & 1 and not occupied & (0b111 << (kingSq - 3)):
+            if not self.attackers_to(kingSq - 1, enemyColor, occupied) and \
+                    not self.attackers_to(kingSq - 2, enemyColor, occupied):
+                moves.append(engine.Move(SQUARES[kingSq], SQUARES[kingSq - 2], self.board, isCastleMove=True))
@@ -0,0 +1,147 @@
+# The opening book answers the first moves of a game instantly, instead of searching positions whose good moves
+# are well known. It is a file of 16-byte entries in the layout of Polyglot books:
+#   key (8 bytes) | move (2 bytes) | weight (2 bytes) | learn (4 bytes), big-endian
+# sorted by key, so all moves of a position are next to each other and found by binary search.
+# Unlike Polyglot, the key is our own State.zobristKey and the move is Move.moveID, so a book built here
+# can only be read by this engine (and Polyglot books can not be read by it).
+# The file is memory-mapped rather than read: opening a book costs the same whatever its size,
+# and a lookup only touches the log2(n) entries the binary search reads.
+#
+# Build a book from games (one game per line, as moves in UCI notation) with:
+#   python book.py build games.txt book.bin [--plies 20]
+import argparse
+import mmap
+import os
+import random
+import struct
+
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+ENTRY_SIZE = ENTRY.size  # 16 bytes
+MAX_WEIGHT = 0xFFFF
+BOOK_PLIES = 20  # number of plies (half moves) of each game that go into a book
+
+
+class OpeningBook():
+    """
+    Read-only view of a book file, looked up by State.zobristKey.
+    Call close() when done with it (or use it in a with statement).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file can not be mapped, and is simply a book without any entry
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entries = size // ENTRY_SIZE
+
+    def __len__(self):
+        return self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmaps and closes the file. """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def get_key(self, index):
+        """Returns the key of the entry at the index. """
+        return ENTRY.unpack_from(self.data, index * ENTRY_SIZE)[0]
+
+    def find_moves(self, key):
+        """Returns the moves stored for a position as a list of (moveID, weight), or an empty list. """
+        # binary search for the first entry with this key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        for index in range(low, self.entries):
+            entryKey, moveID, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY_SIZE)
+            if entryKey != key:
+                break
+            moves.append((moveID, weight))
+        return moves
+
+    def choose_move(self, state, validMoves, rng=random):
+        """
+        Picks one of the book moves of the position at random, in proportion to their weights (so that the bot
+        does not always play the same opening), or returns None if the position is not in the book.
+        The move is returned as the matching Move of validMoves; book moves that are not valid are ignored.
+        """
+        movesByID = {move.moveID: move for move in validMoves}
+        candidates = [(movesByID[moveID], weight) for moveID, weight in self.find_moves(state.zobristKey)
+                      if moveID in movesByID and weight > 0]
+        if not candidates:
+            return None
+        moves, weights = zip(*candidates)
+        return rng.choices(moves, weights)[0]
+
+
+def build_book(games, path, plies=BOOK_PLIES):
+    """
+    Writes a book from games given as lists of moves in UCI notation (e.g. ["e2e4", "e7e5", ...]),
+    each starting from the start position. The weight of a move is the number of games that played it
+    in that position. Returns the number of entries written.
+    """
+    import engine
+
+    counts = {}
+    for game in games:
+        state = engine.State()
+        for uciMove in game[:plies]:
+            movesByNotation = {move.get_uci_notation(): move for move in state.get_valid_moves()}
+            if uciMove not in movesByNotation:
+                break  # the rest of an illegal game can not be trusted
+            move = movesByNotation[uciMove]
+            counts[state.zobristKey, move.moveID] = counts.get((state.zobristKey, move.moveID), 0) + 1
+            state.make_move(move)
+
+    with open(path, "wb") as bookFile:
+        for (key, moveID), count in sorted(counts.items()):
+            bookFile.write(ENTRY.pack(key, moveID, min(count, MAX_WEIGHT), 0))
+    return len(counts)
+
+
+def main():
+    """Builds a book from a file of games, or lists the book moves of a position. """
+    parser = argparse.ArgumentParser(description="Build or probe an opening book.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="build a book from a file of games, one game of UCI moves per line")
+    build.add_argument("games")
+    build.add_argument("book")
+    build.add_argument("--plies", type=int, default=BOOK_PLIES)
+
+    probe = subparsers.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--moves", nargs="*", default=[], help="moves from the start position, in UCI notation")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.games) as gamesFile:
+            games = [line.split() for line in gamesFile if line.strip()]
+        entries = build_book(games, args.book, args.plies)
+        print("{} games, {} entries written to {}".format(len(games), entries, args.book))
+    else:
+        from cli import START_FEN, load_position
+
+        state = load_position(START_FEN, args.moves)
+        movesByID = {move.moveID: move for move in state.get_valid_moves()}
+        with OpeningBook(args.book) as book:
+            for moveID, weight in book.find_moves(state.zobristKey):
+                print(movesByID[moveID].get_uci_notation() if moveID in movesByID else moveID, weight)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 class ChessNotation():
-    __init__(self):
+    """Converts between the board's [row][col] indices and the names of squares in chess notation (e.g. "e4"). """
+
+    def __init__(self):
         self.rankToRow = {"1": 7, "2": 6, "3": 5,
                           "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
         self.rowToRank = {val: key for key, val in self.rankToRow.items()}
@@ -7,8 +9,16 @@ class ChessNotation():
                           "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
         self.colToFile = {val: key for key, val in self.fileToCol.items()}
 
-    def get_chess_notation(self):
+    def get_square_name(self, row, col):
+        """Converts array indices to the name of the square (e.g. [6][4] to "e2"). """
+        return self.colToFile[col] + self.rowToRank[row]
+
+    def get_square(self, name):
+        """Converts the name of a square to array indices (e.g. "e2" to (6, 4)). """
+        return self.rankToRow[name[1]], self.fileToCol[name[0]]
+
+    def get_chess_notation(self, move):
         # Converting array indices to proper chess notation.
-        start = self.colToFile[self.startCol] + self.rowToRank[self.startRow]
-        end = self.colToFile[self.endCol] + self.rowToRank[self.endRow]
+        start = self.get_square_name(move.startRow, move.startCol)
+        end = self.get_square_name(move.endRow, move.endCol)
         return start + "-" + end
@@ -0,0 +1,71 @@
+# Headless entry point: finds the bot's moves without pygame or a display, e.g. for bot workers on a server.
+# Run from this directory with:
+#   python cli.py --fen "<FEN>" [--moves e2e4 e7e5 ...] [--time 1000]   (prints one best move)
+#   python cli.py --stdin < positions.txt                                (one FEN per line, one best move per line)
+# The engine is only imported once a position has to be searched, so e.g. --help starts instantly.
+import argparse
+import sys
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def load_position(fen, moves=(), backend="array"):
+    """Creates a State from a FEN, then plays the given moves (in UCI notation, e.g. "e2e4") on it. """
+    import engine
+
+    state = engine.State.from_fen(fen, backend)
+    for uciMove in moves:
+        validMoves = {move.get_uci_notation(): move for move in state.get_valid_moves()}
+        if uciMove not in validMoves:
+            raise ValueError("illegal move {} in position {}".format(uciMove, state.to_fen()))
+        state.make_move(validMoves[uciMove])
+    return state
+
+
+def find_best_move(state, timeLimit, depth=None, openingBook=None):
+    """
+    Searches the position with iterative deepening for timeLimit milliseconds (or up to a fixed depth),
+    returning the best move in UCI notation, or None if the game is over.
+    Positions found in the opening book, if one is given, are answered from it without searching.
+    """
+    import move_finder
+
+    validMoves = state.get_valid_moves()
+    if not validMoves:
+        return None
+    if depth:
+        bestMove, _ = move_finder.get_best_move_iterative(
+            state, validMoves, timeLimit=None, maxDepth=depth, book=openingBook)
+    else:
+        bestMove, _ = move_finder.get_best_move_iterative(state, validMoves, timeLimit, book=openingBook)
+    # if there is no best move, make a random move (as the GUI's bot does)
+    return (bestMove or move_finder.get_random_move(validMoves)).get_uci_notation()
+
+
+def main(argv=None):
+    """Parses the command line and prints the best move of each position asked for. """
+    parser = argparse.ArgumentParser(description="Find the bot's move without the GUI.")
+    parser.add_argument("--fen", default=START_FEN, help="position to search (the start position by default)")
+    parser.add_argument("--stdin", action="store_true", help="search the positions read from stdin, one FEN per line")
+    parser.add_argument("--moves", nargs="*", default=[], help="moves to play from the FEN first, in UCI notation")
+    parser.add_argument("--time", type=int, default=1000, help="time budget per move, in milliseconds")
+    parser.add_argument("--depth", type=int, help="search to this depth instead of using a time budget")
+    parser.add_argument("--backend", default="array", help="board backend (array or bitboard)")
+    parser.add_argument("--book", help="opening book to play from before searching (see book.py)")
+    args = parser.parse_args(argv)
+    openingBook = None
+    if args.book:
+        import book
+
+        openingBook = book.OpeningBook(args.book)
+
+    fens = (line.strip() for line in sys.stdin if line.strip()) if args.stdin else [args.fen]
+
+    for fen in fens:
+        state = load_position(fen, args.moves, args.backend)
+        bestMove = find_best_move(state, args.time, args.depth, openingBook)
+        print(bestMove or "(none)", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,95 @@
 # the engine will store the State class which will contain the board, turn, and move log
+import random
+
 import numpy as np
 
+import evaluation
+
+"""
+Zobrist hashing:
+Every (piece, square) pair, the side to move, every combination of castling rights and every en passant file
+gets its own random 64-bit number. A position's key is the XOR of the numbers of everything that is true in it,
+so making a move only has to XOR out what changed and XOR in what is new, instead of rehashing the board.
+The generator is seeded so keys are stable between runs (and can be stored, e.g. in an opening book).
+"""
+_zobristRandom = random.Random(20200616)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for piece in ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+# indexed by the castling rights packed into 4 bits (see CastlingRights.index)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]
+# indexed by the column of the en passant square
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+# jumps of a knight and steps of a king, as (row, column) offsets
+KNIGHT_JUMPS = [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)]
+KING_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+# mask of every square: square [i][j] is bit i * 8 + j of the masks used for legality (see update_legality_masks)
+FULL_MASK = (1 << 64) - 1
+# directions each sliding piece moves in
+SLIDER_DIRECTIONS = {"R": [(-1, 0), (0, 1), (1, 0), (0, -1)],
+                     "B": [(-1, -1), (-1, 1), (1, 1), (1, -1)],
+                     "Q": [(-1, 0), (0, 1), (1, 0), (0, -1), (-1, -1), (-1, 1), (1, 1), (1, -1)]}
+# index of each direction in SLIDER_DIRECTIONS["Q"] (orthogonal directions first, followed by diagonals)
+DIRECTION_INDEX = {direction: idx for idx, direction in enumerate(SLIDER_DIRECTIONS["Q"])}
+
+
+def _build_targets(offsets):
+    """
+    For every square [i][j], lists the squares the given offsets lead to that are on the board,
+    as (row, column, bit of the square in a legality mask).
+    """
+    return [[[(i + x, j + y, 1 << ((i + x) * 8 + j + y)) for x, y in offsets if -1 < i + x < 8 and -1 < j + y < 8]
+             for j in range(8)] for i in range(8)]
+
+
+def _build_rays():
+    """
+    For every square [i][j], lists the ray of squares in each direction of SLIDER_DIRECTIONS["Q"] (nearest first,
+    up to the edge of the board), as (row, column, bit of the square in a legality mask).
+    """
+    rays = [[[] for j in range(8)] for i in range(8)]
+    for i in range(8):
+        for j in range(8):
+            for x, y in SLIDER_DIRECTIONS["Q"]:
+                ray = []
+                r, c = i + x, j + y
+                while -1 < r < 8 and -1 < c < 8:
+                    ray.append((r, c, 1 << (r * 8 + c)))
+                    r, c = r + x, c + y
+                rays[i][j].append(ray)
+    return rays
+
+
+# the generators look these tables up instead of adding offsets and checking the edges of the board on every move
+KNIGHT_TARGETS = _build_targets(KNIGHT_JUMPS)
+KING_TARGETS = _build_targets(KING_STEPS)
+RAYS = _build_rays()  # RAYS[i][j][DIRECTION_INDEX[(x, y)]]
+# which rays each sliding piece moves along
+SLIDER_RAYS = {"R": slice(0, 4), "B": slice(4, 8), "Q": slice(0, 8)}
+
 
 class State():
     """Stores the state of the game, and all the chess logic. """
 
-    def __init__(self):
+    def __new__(cls, backend="array"):
+        """
+        Picks the board representation at construction time:
+        - "array": the board is a NumPy array of piece strings (the default)
+        - "bitboard": the board is mirrored by one 64-bit mask per piece (see bitboard.py)
+        Both backends expose the same API, so callers never need to know which one they hold.
+        """
+        if cls is State:
+            if backend == "bitboard":
+                # imported here since bitboard.py itself imports this module
+                from bitboard import BitboardState
+                cls = BitboardState
+            elif backend != "array":
+                raise ValueError("Unknown board backend: " + str(backend))
+        return super().__new__(cls)
+
+    def __init__(self, backend="array"):
+        self.backend = backend  # name of the board representation, so copies (e.g. in other processes) can match it
         self.board = np.array([
             np.array(["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"]),
             np.array(["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"]),
@@ -29,16 +113,245 @@ class State():
         self.inCheck = False  # flag if current player is in check
         self.pins = []  # list of all current pins
         self.checks = []  # list of all current checks
+        # what the move generators know about the safety of the king (see update_legality_masks)
+        self.checkMask = FULL_MASK
+        self.pinMasks = {}
+        self.attackMap = 0
+        self.boardRows = []  # the board as lists, while generating moves (see get_board_rows)
+
+        # optional move_cache.MoveCache consulted by get_valid_moves (e.g. state.moveCache = MoveCache(4096))
+        self.moveCache = None
 
         self.enPassantSquare = ()
+        self.enPassantLog = [()]  # en passant square of every position reached, so undo can restore it
+
+        self.halfmoveClock = 0  # plies since the last capture or pawn move
+        self.halfmoveClockLog = [0]
+        self.fullmoveNumber = 1  # starts at 1 and goes up after every black move
 
         # when initializing the castling rights log, we're creating a new Castling Rights instance, as opposed to using
         # currentCastlingRights, so that we're storing a brand new object and not a reference to one that may be modified
         self.currentCastlingRights = CastlingRights(True, True, True, True)
         self.castlingRightsLog = [CastlingRights(True, True, True, True)]
 
+        # Zobrist key of every position reached so far, kept alongside the move log (the last one is the current key)
+        self.zobristKeyLog = [self.compute_zobrist_key()]
+
+        # evaluation terms, kept up to date by make_move and undo_move so that evaluating a position is O(1):
+        # material (in PIECE_POINTS, positive for white), the middlegame and endgame scores (material and
+        # piece-square tables, in centipawns) and the game phase used to blend them (see evaluation.py)
+        self.evaluationLog = [evaluation.evaluate_board(self.board)]
+        self.material, self.middlegameScore, self.endgameScore, self.phase = self.evaluationLog[-1]
+
+    @classmethod
+    def from_fen(cls, fen, backend="array"):
+        """Creates a State from a position in Forsyth-Edwards Notation (FEN). """
+        state = State(backend)
+        state.load_fen(fen)
+        return state
+
+    def load_fen(self, fen):
+        """
+        Sets up the position described by a FEN string, e.g. the initial position is
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1".
+        The move counters may be left out, in which case they default to 0 and 1.
+        Raises a ValueError naming the field if the string does not describe a position,
+        in which case the state is left as it was.
+        """
+        fields = fen.split()
+        if len(fields) < 4 or len(fields) > 6:
+            raise ValueError("Invalid FEN, expected 4 to 6 fields: " + fen)
+        placement, turn, castling, enPassant = fields[0], fields[1], fields[2], fields[3]
+
+        # placement lists the rows from black's back rank down, with digits counting empty squares
+        board = []
+        for rank in placement.split("/"):
+            row = []
+            for char in rank:
+                if char in "12345678":
+                    row.extend([""] * int(char))
+                elif char not in "PNBRQKpnbrqk":
+                    raise ValueError("Invalid FEN piece: " + char)
+                else:
+                    # upper case letters are white pieces, lower case ones black
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+            if len(row) != 8:
+                raise ValueError("Invalid FEN row: " + rank)
+            board.append(row)
+        if len(board) != 8 or placement.count("K") != 1 or placement.count("k") != 1:
+            raise ValueError("Invalid FEN placement (8 rows and one king of each color): " + placement)
+        if any(piece[1:] == "P" for piece in board[0] + board[7]):
+            raise ValueError("Invalid FEN placement (a pawn on the first or last rank): " + placement)
+
+        if turn not in ("w", "b"):
+            raise ValueError("Invalid FEN side to move: " + turn)
+
+        # each right at most once, and only with the king and the rook still on their starting squares
+        if castling != "-" and \
+                (not castling or any(char not in "KQkq" or castling.count(char) > 1 for char in castling)):
+            raise ValueError("Invalid FEN castling rights: " + castling)
+        for char, (row, kingCol, rookCol) in (("K", (7, 4, 7)), ("Q", (7, 4, 0)), ("k", (0, 4, 7)), ("q", (0, 4, 0))):
+            color = "w" if char.isupper() else "b"
+            if char in castling and (board[row][kingCol] != color + "K" or board[row][rookCol] != color + "R"):
+                raise ValueError("Invalid FEN castling rights, {} without its king and rook: {}".format(char, castling))
+
+        # the en passant square is the one a pawn of the opponent just skipped with a double push
+        if enPassant == "-":
+            enPassantSquare = ()
+        else:
+            if len(enPassant) != 2 or enPassant[0] not in "abcdefgh" or enPassant[1] != ("6" if turn == "w" else "3"):
+                raise ValueError("Invalid FEN en passant square: " + enPassant)
+            enPassantSquare = (8 - int(enPassant[1]), "abcdefgh".index(enPassant[0]))
+
+        clocks = fields[4:]
+        if any(not clock.isdigit() or not clock.isascii() for clock in clocks) or \
+                (len(clocks) > 1 and int(clocks[1]) < 1):
+            raise ValueError("Invalid FEN move counters: " + " ".join(clocks))
+
+        self.board = np.array(board, dtype="<U2")
+        self.whiteKingPosition = next((i, j) for i in range(8) for j in range(8) if board[i][j] == "wK")
+        self.blackKingPosition = next((i, j) for i in range(8) for j in range(8) if board[i][j] == "bK")
+        self.whiteToMove = turn == "w"
+        self.currentCastlingRights = CastlingRights(
+            "K" in castling, "Q" in castling, "k" in castling, "q" in castling)
+        self.castlingRightsLog = [CastlingRights(
+            "K" in castling, "Q" in castling, "k" in castling, "q" in castling)]
+        self.enPassantSquare = enPassantSquare
+        self.enPassantLog = [self.enPassantSquare]
+
+        self.halfmoveClock = int(clocks[0]) if clocks else 0
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.fullmoveNumber = int(clocks[1]) if len(clocks) > 1 else 1
+
+        self.log = []
+        self.checkmate = False
+        self.stalemate = False
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkMask = FULL_MASK
+        self.pinMasks = {}
+        self.attackMap = 0
+        self.zobristKeyLog = [self.compute_zobrist_key()]
+        self.evaluationLog = [evaluation.evaluate_board(self.board)]
+        self.material, self.middlegameScore, self.endgameScore, self.phase = self.evaluationLog[-1]
+
+    def to_fen(self):
+        """Returns the current position in Forsyth-Edwards Notation (FEN). """
+        rows = []
+        for i in range(8):
+            row = ""
+            empty = 0  # number of empty squares in a row so far
+            for j in range(8):
+                piece = self.board[i][j]
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                # white pieces are written in upper case, black pieces in lower case
+                row += piece[1] if piece[0] == "w" else piece[1].lower()
+            if empty:
+                row += str(empty)
+            rows.append(row)
+
+        rights = self.currentCastlingRights
+        castling = ("K" if rights.whiteKingSide else "") + ("Q" if rights.whiteQueenSide else "") + \
+            ("k" if rights.blackKingSide else "") + ("q" if rights.blackQueenSide else "")
+        if self.enPassantSquare:
+            enPassant = "abcdefgh"[self.enPassantSquare[1]] + str(8 - self.enPassantSquare[0])
+        else:
+            enPassant = "-"
+
+        return " ".join(["/".join(rows), "w" if self.whiteToMove else "b", castling or "-", enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)])
+
+    @property
+    def zobristKey(self):
+        """The 64-bit Zobrist key of the current position. """
+        return self.zobristKeyLog[-1]
+
+    def compute_zobrist_key(self):
+        """Computes the Zobrist key of the current position from scratch (make_move updates it incrementally). """
+        key = 0
+        for i in range(8):
+            for j in range(8):
+                if self.board[i][j]:
+                    key ^= ZOBRIST_PIECES[self.board[i][j]][i * 8 + j]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRights.index()]
+        if self.enPassantSquare:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+        return key
+
+    def get_repetition_count(self, limit=3):
+        """
+        Counts how many times the current position has been reached (itself included), stopping once `limit` is hit.
+        Only the positions since the last capture or pawn move can repeat it, so the key log is only scanned back
+        that far (the halfmove clock), and only every other ply, where the same side was to move.
+        """
+        keys = self.zobristKeyLog
+        key = keys[-1]
+        count = 1
+        # the oldest position that can be the same as this one (the key log may start after the last irreversible move)
+        oldest = max(len(keys) - 1 - self.halfmoveClock, 0)
+        for index in range(len(keys) - 5, oldest - 1, -2):  # a position can not repeat within less than 4 plies
+            if keys[index] == key:
+                count += 1
+                if count >= limit:
+                    break
+        return count
+
+    def is_threefold_repetition(self):
+        """Determine if the current position has been reached three times, which makes the game a draw. """
+        return self.halfmoveClock >= 8 and self.get_repetition_count() >= 3
+
+    def is_fifty_move_rule(self):
+        """Determine if fifty moves (100 plies) went by without a capture or pawn move, which makes the game a draw. """
+        return self.halfmoveClock >= 100
+
+    def make_null_move(self):
+        """
+        Passes the turn to the opponent without moving (for null-move pruning in the search; never legal in a game).
+        Any en passant capture is lost, and the halfmove clock restarts, so that no repetition is detected
+        across the null move. It is not added to the move log: take it back with undo_null_move, not undo_move.
+        """
+        key = self.zobristKeyLog[-1] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enPassantSquare:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+        self.zobristKeyLog.append(key)
+        self.enPassantSquare = ()
+        self.enPassantLog.append(())
+        self.halfmoveClock = 0
+        self.halfmoveClockLog.append(0)
+        self.whiteToMove = not self.whiteToMove
+
+    def undo_null_move(self):
+        """Takes back make_null_move. """
+        self.whiteToMove = not self.whiteToMove
+        self.halfmoveClockLog.pop()
+        self.halfmoveClock = self.halfmoveClockLog[-1]
+        self.enPassantLog.pop()
+        self.enPassantSquare = self.enPassantLog[-1]
+        self.zobristKeyLog.pop()
+
+    def has_non_pawn_material(self):
+        """
+        Determine if the side to move has any piece besides its king and pawns. With only those left, zugzwang
+        (every move makes the position worse) is common, so passing the turn is no guide to the position's value.
+        """
+        allyColor = "w" if self.whiteToMove else "b"
+        for row in self.get_board_rows():
+            for piece in row:
+                if piece and piece[0] == allyColor and piece[1] != "P" and piece[1] != "K":
+                    return True
+        return False
+
     def make_move(self, move):
         """Takes a move and executes it (not working with castling, en passant). """
+        previousEnPassantSquare = self.enPassantSquare
 
         # move piece from starting position to ending position
         self.board[move.startRow][move.startCol] = ""
@@ -56,25 +369,13 @@ class State():
             self.whiteKingPosition = (move.endRow, move.endCol)
         elif move.pieceMoved == "bK":
             self.blackKingPosition = (move.endRow, move.endCol)
-        # promote pawn to queen if it reaches the final row
-        elif move.pieceMoved == "wP" and move.endRow == 0:
-            self.board[move.endRow][move.endCol] = "wQ"
-        elif move.pieceMoved == "bP" and move.endRow == 7:
-            self.board[move.endRow][move.endCol] = "bQ"
+        # promote pawn to the chosen piece if it reaches the final row
+        elif move.isPawnPromotion:
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
         """
         Updating En Passant Information:
-        NTE TO SELF: I SHOULD PROBABLY MODULARIZE THIS INTO ITS OWN FUNCTION
         """
-        # update the potential en passant square
-        # by taking the average of the rows but keep the same col (i.e. the square that was skipped)
-        if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-            self.enPassantSquare = (
-                (move.startRow + move.endRow) // 2, move.endCol)
-        # otherwise, if it wasn't a pawn that moved up two, en passant is reset
-        else:
-            self.enPassantSquare = ()
-
         # clear captured piece if it's an en passant move
         if move.isEnPassantMove:
             self.board[move.startRow][move.endCol] = ""
@@ -107,6 +408,20 @@ class State():
                                         1] = self.board[move.endRow][move.endCol-2]
                 self.board[move.endRow][move.endCol-2] = ""
 
+        self.enPassantLog.append(self.enPassantSquare)
+
+        """
+        Updating Move Counters:
+        """
+        # the halfmove clock is reset by captures and pawn moves, since neither can ever be undone
+        if move.pieceMoved[1] == "P" or move.pieceCaptured:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if move.pieceMoved[0] == "b":
+            self.fullmoveNumber += 1
+
         # call function to update the current rights
         self.update_castling_rights(move)
 
@@ -114,6 +429,77 @@ class State():
         self.castlingRightsLog.append(CastlingRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.whiteQueenSide,
                                                      self.currentCastlingRights.blackKingSide, self.currentCastlingRights.blackQueenSide))
 
+        self.update_zobrist_key(move, previousEnPassantSquare)
+        self.update_evaluation(move)
+
+    def update_zobrist_key(self, move, previousEnPassantSquare):
+        """Helper function that pushes the key of the position reached by the move, XORing in only what changed. """
+        key = self.zobristKeyLog[-1]
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+
+        # lift the moved piece, remove the captured one, and place whatever now stands on the end square (promotion)
+        key ^= ZOBRIST_PIECES[move.pieceMoved][startSq]
+        if move.isEnPassantMove:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][endSq]
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][endSq]
+
+        # the rook also moves when castling
+        if move.isCastleMove:
+            rook = ZOBRIST_PIECES[move.pieceMoved[0] + "R"]
+            if move.endCol - move.startCol == 2:
+                key ^= rook[endSq + 1] ^ rook[endSq - 1]
+            else:
+                key ^= rook[endSq - 2] ^ rook[endSq + 1]
+
+        key ^= ZOBRIST_CASTLING[self.castlingRightsLog[-2].index()] ^ \
+            ZOBRIST_CASTLING[self.castlingRightsLog[-1].index()]
+        if previousEnPassantSquare:
+            key ^= ZOBRIST_EN_PASSANT[previousEnPassantSquare[1]]
+        if self.enPassantSquare:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+        key ^= ZOBRIST_BLACK_TO_MOVE
+
+        self.zobristKeyLog.append(key)
+
+    def update_evaluation(self, move):
+        """Helper function that updates the evaluation terms with only the pieces the move changed. """
+        middlegameScores = evaluation.MIDDLEGAME_SCORES
+        endgameScores = evaluation.ENDGAME_SCORES
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        pieceMoved = move.pieceMoved
+        piecePlaced = self.board[move.endRow][move.endCol]  # differs from the moved piece after a promotion
+
+        material, middlegame, endgame, phase = self.evaluationLog[-1]
+        middlegame += middlegameScores[piecePlaced][endSq] - middlegameScores[pieceMoved][startSq]
+        endgame += endgameScores[piecePlaced][endSq] - endgameScores[pieceMoved][startSq]
+        if piecePlaced != pieceMoved:
+            material += evaluation.MATERIAL[piecePlaced] - evaluation.MATERIAL[pieceMoved]
+            phase += evaluation.PHASE[piecePlaced] - evaluation.PHASE[pieceMoved]
+
+        if move.pieceCaptured:
+            capturedSq = move.startRow * 8 + move.endCol if move.isEnPassantMove else endSq
+            material -= evaluation.MATERIAL[move.pieceCaptured]
+            middlegame -= middlegameScores[move.pieceCaptured][capturedSq]
+            endgame -= endgameScores[move.pieceCaptured][capturedSq]
+            phase -= evaluation.PHASE[move.pieceCaptured]
+
+        # the rook also moves when castling
+        if move.isCastleMove:
+            rook = pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2:
+                rookStart, rookEnd = endSq + 1, endSq - 1
+            else:
+                rookStart, rookEnd = endSq - 2, endSq + 1
+            middlegame += middlegameScores[rook][rookEnd] - middlegameScores[rook][rookStart]
+            endgame += endgameScores[rook][rookEnd] - endgameScores[rook][rookStart]
+
+        self.evaluationLog.append((material, middlegame, endgame, phase))
+        self.material, self.middlegameScore, self.endgameScore, self.phase = material, middlegame, endgame, phase
+
     def update_castling_rights(self, move):
         """Helper function that  updates castling information when either a rook or a king is moved. """
 
@@ -146,11 +532,27 @@ class State():
                     # king side rook (right)
                     self.currentCastlingRights.blackKingSide = False
 
+        # capturing a rook on its starting square also takes away that side's castling right
+        if move.pieceCaptured == "wR" and move.endRow == 7:
+            if move.endCol == 0:
+                self.currentCastlingRights.whiteQueenSide = False
+            elif move.endCol == 7:
+                self.currentCastlingRights.whiteKingSide = False
+        elif move.pieceCaptured == "bR" and move.endRow == 0:
+            if move.endCol == 0:
+                self.currentCastlingRights.blackQueenSide = False
+            elif move.endCol == 7:
+                self.currentCastlingRights.blackKingSide = False
+
     def undo_move(self):
         """Takes the last move and undoes it. """
         if self.log:
             # remove last move from log, if one exists
             lastMove = self.log.pop()
+            # the previous position's key is still on the key log, so no rehashing is needed
+            self.zobristKeyLog.pop()
+            self.evaluationLog.pop()
+            self.material, self.middlegameScore, self.endgameScore, self.phase = self.evaluationLog[-1]
 
             # clear ending position and put piece back on starting position
             self.board[lastMove.endRow][lastMove.endCol] = lastMove.pieceCaptured
@@ -176,11 +578,18 @@ class State():
             if lastMove.isEnPassantMove:
                 self.board[lastMove.endRow][lastMove.endCol] = ""
                 self.board[lastMove.startRow][lastMove.endCol] = lastMove.pieceCaptured
-                self.enPassantSquare = (lastMove.endRow, lastMove.endCol)
 
-            # ... and undoing a pawn moving 2 spots
-            if lastMove.pieceMoved[1] == "P" and abs(lastMove.startRow - lastMove.endRow) == 2:
-                self.enPassantSquare = ()
+            # ... and restoring the en passant square from before the move (which any move may have reset)
+            self.enPassantLog.pop()
+            self.enPassantSquare = self.enPassantLog[-1]
+
+            """
+            Undoing Move Counters:
+            """
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            if lastMove.pieceMoved[0] == "b":
+                self.fullmoveNumber -= 1
 
             """
             Undoing Castling Rights and Castling Move:
@@ -216,307 +625,125 @@ class State():
     def get_pawn_moves(self, i, j, moves):
         """Generate all possible pawn moves. """
 
-        # We need to identify if the pawn is pinned.
-        # as well, if it is, we need to make sure that we can only
-        # move that piece in the direction of the pin.
-        # Finally, we'll also consider en passant moves
-        isPinned = False
-        pinDirection = ()  # direction the piece is being pinned from
-
-        for idx, pin in enumerate(self.pins):
-            if pin[0] == i and pin[1] == j:
-                isPinned = True
-                pinDirection = (pin[2], pin[3])
-                self.pins.remove(self.pins[idx])  # NOT SURE WHY WE DO THIS YET
-                break
-
-        # white pawns
+        # squares this pawn may move to (see update_legality_masks): only along the line of its pin if it is pinned,
+        # and only onto the checking piece or between it and the king if we are in check
+        allowed = self.checkMask & self.pinMasks.get(i * 8 + j, FULL_MASK)
+        board = self.boardRows
         if self.whiteToMove:
-            if not self.board[i-1][j]:  # one square up
-                if not isPinned or pinDirection == (-1, 0):
-                    # we can only make this move if the pawn isn't pinned,
-                    # or if it's moving up in the direction of the pin (from a rook or queen)
-                    moves.append(Move([i, j], [i-1, j], self.board))
-                    if i == 6 and not self.board[i-2][j]:  # two squares up
-                        moves.append(Move([i, j], [i-2, j], self.board))
-
-            # check capture up-left, then up-right
-            if j > 0:
-                if self.board[i-1][j-1] and self.board[i-1][j-1][0] == "b":
-                    if not isPinned or pinDirection == (-1, -1):
-                        # if the piece isn't pinned or it's pinned from the upper-left (from a bishop or queen)
-                        moves.append(Move([i, j], [i-1, j-1], self.board))
-                # if there's no enemy there, also check for en passant
-                elif (i-1, j-1) == self.enPassantSquare:
-                    # passing in optional parameter to indicate en passant
-                    moves.append(
-                        Move([i, j], [i-1, j-1], self.board, isEnPassantMove=True))
-
-            if j < 7:
-                if self.board[i-1][j+1] and self.board[i-1][j+1][0] == "b":
-                    if not isPinned or pinDirection == (-1, 1):
-                        moves.append(Move([i, j], [i-1, j+1], self.board))
-                # if there's no enemy there, also check for en passant
-                elif (i-1, j+1) == self.enPassantSquare:
-                    # passing in optional parameter to indicate en passant
-                    moves.append(
-                        Move([i, j], [i-1, j+1], self.board, isEnPassantMove=True))
-
-        # black pawns
+            direction, startRow, enemyColor = -1, 6, "b"  # white pawns move up
         else:
-            if not self.board[i+1][j]:  # one square down
-                if not isPinned or pinDirection == (1, 0):
-                    # notice direction of pin is reversed from white pawn logic above
-                    moves.append(Move([i, j], [i+1, j], self.board))
-                    if i == 1 and not self.board[i+2][j]:  # two squares down
-                        moves.append(Move([i, j], [i+2, j], self.board))
-
-            # check capture down-left, then down-right
-            if j > 0:
-                if self.board[i+1][j-1] and self.board[i+1][j-1][0] == "w":
-                    if not isPinned or pinDirection == (1, -1):
-                        moves.append(Move([i, j], [i+1, j-1], self.board))
-                elif (i+1, j-1) == self.enPassantSquare:
+            direction, startRow, enemyColor = 1, 1, "w"  # black pawns move down
+        r = i + direction
+
+        if not board[r][j]:  # one square forward
+            if allowed >> (r * 8 + j) & 1:
+                self.add_pawn_move((i, j), (r, j), moves, board)
+            # two squares forward (which may block a check even if one square does not)
+            if i == startRow and not board[r + direction][j] and allowed >> ((r + direction) * 8 + j) & 1:
+                moves.append(Move((i, j), (r + direction, j), board))
+
+        # check captures to the left, then to the right
+        for c in (j - 1, j + 1):
+            if -1 < c < 8:
+                if board[r][c] and board[r][c][0] == enemyColor:
+                    if allowed >> (r * 8 + c) & 1:
+                        self.add_pawn_move((i, j), (r, c), moves, board)
+                # if there's no enemy there, also check for en passant, which is played out to check the king
+                # instead of using the masks (the captured pawn is not on the square the pawn moves to)
+                elif (r, c) == self.enPassantSquare and self.is_en_passant_safe(i, j, r, c):
                     # passing in optional parameter to indicate en passant
-                    moves.append(
-                        Move([i, j], [i+1, j-1], self.board, isEnPassantMove=True))
+                    moves.append(Move((i, j), (r, c), board, isEnPassantMove=True))
+
+    def add_pawn_move(self, startSq, endSq, moves, board=None):
+        """Adds a pawn move, or one move per promotion choice if the pawn reaches the final row. """
+        if board is None:
+            board = self.board
+        if endSq[0] == 0 or endSq[0] == 7:
+            # queen first, so that the first matching move is a queen promotion
+            for promotionChoice in ("Q", "R", "B", "N"):
+                moves.append(Move(startSq, endSq, board, promotionChoice=promotionChoice))
+        else:
+            moves.append(Move(startSq, endSq, board))
 
-            if j < 7:
-                if self.board[i+1][j+1] and self.board[i+1][j+1][0] == "w":
-                    if not isPinned or pinDirection == (1, 1):
-                        moves.append(Move([i, j], [i+1, j+1], self.board))
-                elif (i+1, j+1) == self.enPassantSquare:
-                    # passing in optional parameter to indicate en passant
-                    moves.append(
-                        Move([i, j], [i+1, j+1], self.board, isEnPassantMove=True))
+    def is_en_passant_safe(self, i, j, r, c):
+        """
+        Determine if capturing en passant from [i][j] to [r][c] leaves our king safe.
+        En passant removes two pawns from the board at once, which can expose the king in ways
+        the pin detection does not see (e.g. both pawns leaving the king's row while a rook waits behind them),
+        so we simply play the capture on the board, check the king, and put the pawns back.
+        """
+        pawn = self.board[i][j]
+        capturedPawn = self.board[i][c]
+        self.board[i][j] = ""
+        self.board[i][c] = ""
+        self.board[r][c] = pawn
+
+        kingRow, kingCol = self.whiteKingPosition if self.whiteToMove else self.blackKingPosition
+        isSafe = not self.is_under_attack(kingRow, kingCol)
+
+        self.board[r][c] = ""
+        self.board[i][c] = capturedPawn
+        self.board[i][j] = pawn
+        return isSafe
 
     def get_rook_moves(self, i, j, moves):
         """Generate all possible rook moves. """
+        self.get_slider_moves(i, j, moves, RAYS[i][j][SLIDER_RAYS["R"]])
 
-        # We need to identify if the rook is pinned.
-        # as well, if it is, we need to make sure that we can only
-        # move that piece in the direction of the pin (or away from it)
-        isPinned = False
-        pinDirection = ()  # direction the piece is being pinned from
-
-        for idx, pin in enumerate(self.pins):
-            if pin[0] == i and pin[1] == j:
-                isPinned = True
-                pinDirection = (pin[2], pin[3])
-                if self.board[i][j][1] != "Q":  # NOT SURE WHY THIS CONDITION YET
-                    # NOT SURE WHY WE DO THIS YET
-                    self.pins.remove(self.pins[idx])
-                break
-
-        # When checking for all the pin directions for the rook, we also need to
-        # allow the rook to move toward (and away from) the pin, as both movements
-        # will continue to protect the king
+    def get_slider_moves(self, i, j, moves, rays):
+        """Generate all possible moves of the rook, bishop or queen on [i][j], sliding along the given rays. """
 
-        # check up
-        for r in range(i-1, -1, -1):
-            if not isPinned or pinDirection == (-1, 0) or pinDirection == (1, 0):
-                if not self.board[r][j]:  # if square is empty
-                    moves.append(Move([i, j], [r, j], self.board))
-                else:
-                    if (self.board[r][j][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][j][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, j], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-        # check right
-        for c in range(j+1, 8, 1):
-            if not isPinned or pinDirection == (0, 1) or pinDirection == (1, 0):
-                if not self.board[i][c]:  # if square is empty
-                    moves.append(Move([i, j], [i, c], self.board))
-                else:
-                    if (self.board[i][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[i][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [i, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-        # check down
-        for r in range(i+1, 8, 1):
-            if not isPinned or pinDirection == (1, 0) or pinDirection == (-1, 0):
-                if not self.board[r][j]:  # if square is empty
-                    moves.append(Move([i, j], [r, j], self.board))
-                else:
-                    if (self.board[r][j][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][j][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, j], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-        # check left
-        for c in range(j-1, -1, -1):
-            if not isPinned or pinDirection == (0, -1) or pinDirection == (0, 1):
-                if not self.board[i][c]:  # if square is empty
-                    moves.append(Move([i, j], [i, c], self.board))
-                else:
-                    if (self.board[i][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[i][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [i, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
+        # squares this piece may move to (see update_legality_masks): a pinned piece can still move toward
+        # (and away from) the pinning piece, as both movements continue to protect the king
+        allowed = self.checkMask & self.pinMasks.get(i * 8 + j, FULL_MASK)
+        if not allowed:
+            return
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.boardRows
+
+        for ray in rays:
+            for r, c, bit in ray:
+                endPiece = board[r][c]
+                if endPiece and endPiece[0] != enemyColor:
+                    break  # our own piece blocks the way
+                if allowed & bit:
+                    moves.append(Move((i, j), (r, c), board))
+                if endPiece:
+                    break  # an enemy piece can be captured, but we can't keep moving past it
 
     def get_knight_moves(self, i, j, moves):
         """Generate all possible knight moves. """
 
-        # We need to identify if the knight is pinned.
-        # if it is, there is no way for us to capture the piece
-        # that's pinning it, so we need to stop it from moving
-
-        isPinned = False
-
-        for idx, pin in enumerate(self.pins):
-            if pin[0] == i and pin[1] == j:
-                isPinned = True
-                self.pins.remove(self.pins[idx])  # NOT SURE WHY WE DO THIS YET
-                break
-
-        # there are no possible moves for a knight if it is pinned by another piece
-        if isPinned:
+        # there are no possible moves for a knight if it is pinned by another piece,
+        # since it can never stay on the line of the pin
+        if i * 8 + j in self.pinMasks:
             return
 
-        # all possible jumps in horiz/vert distance from current square
-        jumps = [(-2, 1), (-1, 2), (1, 2), (2, 1),
-                 (2, -1), (1, -2), (-1, -2), (-2, -1)]
-        for x, y in jumps:
-            r, c = i + x, j + y
-            if -1 < r < 8 and -1 < c < 8:  # if the cell exists
-                # if square is empty or occupied by opponent
-                if (not self.board[r][c]) or \
-                    ((self.board[r][c][0] == "w" and not self.whiteToMove) or
-                        (self.board[r][c][0] == "b" and self.whiteToMove)):
-                    moves.append(Move([i, j], [r, c], self.board))
+        allowed = self.checkMask
+        allyColor = "w" if self.whiteToMove else "b"
+        board = self.boardRows
+        for r, c, bit in KNIGHT_TARGETS[i][j]:
+            # if square is empty or occupied by opponent
+            if (not board[r][c] or board[r][c][0] != allyColor) and allowed & bit:
+                moves.append(Move((i, j), (r, c), board))
 
     def get_bishop_moves(self, i, j, moves):
         """Generate all possible bishop moves. """
-
-        # We need to identify if the bishop is pinned.
-        # as well, if it is, we need to make sure that we can only
-        # move that piece in the direction of the pin (or away from it)
-        isPinned = False
-        pinDirection = ()  # direction the piece is being pinned from
-
-        for idx, pin in enumerate(self.pins):
-            if pin[0] == i and pin[1] == j:
-                isPinned = True
-                pinDirection = (pin[2], pin[3])
-                self.pins.remove(self.pins[idx])  # NOT SURE WHY WE DO THIS YET
-                break
-
-        # When checking for all the pin directions for the bishop, we also need to
-        # allow the bishop to move toward (and away from) the pin, as both movements
-        # will continue to protect the king
-
-        # check up-left
-        r, c = i - 1, j - 1
-        while r > -1 and c > -1:
-            if not isPinned or pinDirection == (-1, -1) or pinDirection == (1, 1):
-                if not self.board[r][c]:  # if square is empty
-                    moves.append(Move([i, j], [r, c], self.board))
-                else:
-                    if (self.board[r][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-                r -= 1
-                c -= 1
-            else:
-                # if pinned and the pin direction isn't in line with potential move,
-                # we need to break out and avoid an infinite loop
-                break
-
-        # check up-right
-        r, c = i - 1, j + 1
-        while r > -1 and c < 8:
-            if not isPinned or pinDirection == (-1, 1) or pinDirection == (1, -1):
-                if not self.board[r][c]:
-                    moves.append(Move([i, j], [r, c], self.board))
-                else:
-                    if (self.board[r][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-                r -= 1
-                c += 1
-            else:
-                # if pinned and the pin direction isn't in line with potential move,
-                # we need to break out and avoid an infinite loop
-                break
-
-        # check down-right
-        r, c = i + 1, j + 1
-        while r < 8 and c < 8:
-            if not isPinned or pinDirection == (1, 1) or pinDirection == (-1, -1):
-                if not self.board[r][c]:
-                    moves.append(Move([i, j], [r, c], self.board))
-                else:
-                    if (self.board[r][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-                r += 1
-                c += 1
-            else:
-                # if pinned and the pin direction isn't in line with potential move,
-                # we need to break out and avoid an infinite loop
-                break
-
-        # check down-left
-        r, c = i + 1, j - 1
-        while r < 8 and c > -1:
-            if not isPinned or pinDirection == (1, -1) or pinDirection == (-1, 1):
-                if not self.board[r][c]:
-                    moves.append(Move([i, j], [r, c], self.board))
-                else:
-                    if (self.board[r][c][0] == "w" and not self.whiteToMove) or \
-                            (self.board[r][c][0] == "b" and self.whiteToMove):
-                        moves.append(Move([i, j], [r, c], self.board))
-                    break  # break out of the for loop since we can't keep checking further
-
-                r += 1
-                c -= 1
-            else:
-                # if pinned and the pin direction isn't in line with potential move,
-                # we need to break out and avoid an infinite loop
-                break
+        self.get_slider_moves(i, j, moves, RAYS[i][j][SLIDER_RAYS["B"]])
 
     def get_queen_moves(self, i, j, moves):
         """Generate all possible queen moves. """
-        self.get_rook_moves(i, j, moves)
-        self.get_bishop_moves(i, j, moves)
+        self.get_slider_moves(i, j, moves, RAYS[i][j])
 
     def get_king_moves(self, i, j, moves):
-        # after we make a king move, we need to make sure that it's not in check
-        # we're going to do this by simulating the king move, and then calling the `find_pins_and_checks` function
-        kingMoves = [(-1, -1), (-1, 0), (-1, 1), (0, 1),
-                     (1, 1), (1, 0), (1, -1), (0, -1)]
+        """Generate all possible king moves: to any square that is not attacked (see update_legality_masks). """
         allyColor = "w" if self.whiteToMove else "b"
-        for x, y in kingMoves:
-            r, c = i + x, j + y
-            if -1 < r < 8 and -1 < c < 8:  # if the adjacent cell exists
-                endPiece = self.board[r][c]
-                # if the cell is empty or occupied by opponent
-                if (not endPiece) or \
-                    ((endPiece[0] == "w" and not self.whiteToMove) or
-                        (endPiece[0] == "b" and self.whiteToMove)):
-
-                    if self.whiteToMove:
-                        self.whiteKingPosition = (r, c)
-                    else:
-                        self.blackKingPosition = (r, c)
-
-                    inCheck, pins, checks = self.find_pins_and_checks()
-
-                    if not inCheck:
-                        moves.append(Move([i, j], [r, c], self.board))
-
-                    if self.whiteToMove:
-                        self.whiteKingPosition = (i, j)
-                    else:
-                        self.blackKingPosition = (i, j)
+        board = self.boardRows
+        for r, c, bit in KING_TARGETS[i][j]:
+            endPiece = board[r][c]
+            # if the cell is empty or occupied by opponent, and the opponent does not attack it
+            if (not endPiece or endPiece[0] != allyColor) and not self.attackMap & bit:
+                moves.append(Move((i, j), (r, c), board))
 
     def get_castling_moves(self, i, j, moves, allyColor):
         """
@@ -531,25 +758,26 @@ class State():
         if self.is_under_attack(i, j):
             return
 
-        # 2a) Check king side spots to make sure they're clear
+        # 2a) Check king side spots to make sure they're clear (and that the rook is still in its corner)
         if (self.whiteToMove and self.currentCastlingRights.whiteKingSide) or \
                 (not self.whiteToMove and self.currentCastlingRights.blackKingSide):
-            if not self.board[i][j+1] and not self.board[i][j+2]:
+            if not self.board[i][j+1] and not self.board[i][j+2] and self.board[i][j+3] == allyColor + "R":
                 # 3a) Check that the squares are not under attack
                 if not self.is_under_attack(i, j+1) and not self.is_under_attack(i, j+2):
                     moves.append(
-                        Move([i, j], [i, j+2], self.board, isCastleMove=True))
+                        Move((i, j), (i, j+2), self.board, isCastleMove=True))
 
-        # 2b) Check queen side spots to make sure they're clear
+        # 2b) Check queen side spots to make sure they're clear (and that the rook is still in its corner)
         if (self.whiteToMove and self.currentCastlingRights.whiteQueenSide) or \
                 (not self.whiteToMove and self.currentCastlingRights.blackQueenSide):
-            if not self.board[i][j-1] and not self.board[i][j-2] and not self.board[i][j-3]:
+            if not self.board[i][j-1] and not self.board[i][j-2] and not self.board[i][j-3] and \
+                    self.board[i][j-4] == allyColor + "R":
                 # 3b) Check that the squares are not under attack
                 if not self.is_under_attack(i, j-1) and not self.is_under_attack(i, j-2):
                     # Note that since the king never passes through the 3rd square to its right,
                     # we don't need to check whether that square is under attack
                     moves.append(
-                        Move([i, j], [i, j-2], self.board, isCastleMove=True))
+                        Move((i, j), (i, j-2), self.board, isCastleMove=True))
 
         # 4) Note that the condition of king / rook not having made prior moves is checked when we
         # examine the self.currentCastlingRights object.
@@ -562,24 +790,70 @@ class State():
             return self.is_under_attack(self.blackKingPosition[0], self.blackKingPosition[1])
 
     def is_under_attack(self, i, j):
-        """ Determine if a specific square is under attack. """
+        """
+        Determine if a specific square is under attack by the opponent.
+        Instead of generating the opponent's moves, we look outward from the square: along the 8 rays for sliders
+        (and an adjacent king), at the 8 knight jumps, and at the 2 squares a pawn could attack it from.
+        """
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.board
+
+        # the rays are sorted by orthogonal directions, followed by diagonals
+        for idx, ray in enumerate(RAYS[i][j]):
+            # rooks attack along orthogonals, bishops along diagonals, queens along both
+            slider = "R" if idx < 4 else "B"
+            for distance, (r, c, bit) in enumerate(ray, 1):
+                piece = board[r][c]
+                if piece:
+                    # the first piece on the ray blocks everything behind it
+                    if piece[0] == enemyColor and \
+                            (piece[1] == slider or piece[1] == "Q" or (distance == 1 and piece[1] == "K")):
+                        return True
+                    break
+
+        for r, c, bit in KNIGHT_TARGETS[i][j]:
+            piece = board[r][c]
+            if piece and piece[0] == enemyColor and piece[1] == "N":
+                return True
+
+        # white pawns attack upward, so they attack from the row below the square (and black pawns from above)
+        pawnRow = i + 1 if enemyColor == "w" else i - 1
+        if -1 < pawnRow < 8:
+            for c in (j - 1, j + 1):
+                if -1 < c < 8 and board[pawnRow][c] == enemyColor + "P":
+                    return True
+
+        return False
+
+    def is_under_attack_by_generation(self, i, j):
+        """
+        Determine if a specific square is under attack by generating all of the opponent's moves.
+        This is the original (slow) implementation, kept as a reference for checking is_under_attack.
+        Note that it counts pawn pushes as attacks and misses pawn attacks on empty squares.
+        """
 
-        # switch turns to validate opponent's possible moves
+        # switch turns to validate opponent's possible moves, ignoring pins and checks of the opponent
+        # (a pinned piece still attacks the squares around our king), then put everything back
+        masks = self.checkMask, self.pinMasks, self.attackMap
         self.whiteToMove = not self.whiteToMove
+        self.checkMask, self.pinMasks = FULL_MASK, {}
+        self.boardRows = self.get_board_rows()
+        self.attackMap = self.get_attack_map()
         opponentMoves = self.get_all_possible_moves()
+        self.whiteToMove = not self.whiteToMove  # switch turns back
+        self.checkMask, self.pinMasks, self.attackMap = masks
+
         for move in opponentMoves:
             if move.endRow == i and move.endCol == j:
-                self.whiteToMove = not self.whiteToMove  # switch turns back
                 return True
-
-        # switch turns back if not under attack
-        self.whiteToMove = not self.whiteToMove
+        return False
 
     def find_pins_and_checks(self):
         """ Identifies all pins and checks on the king. """
         inCheck = False
         pins = []
         checks = []
+        board = self.get_board_rows()
 
         startRow = self.whiteKingPosition[0] if self.whiteToMove else self.blackKingPosition[0]
         startCol = self.whiteKingPosition[1] if self.whiteToMove else self.blackKingPosition[1]
@@ -587,156 +861,229 @@ class State():
         enemyColor = "b" if self.whiteToMove else "w"
 
         # sorted by orthogonal directions, followed by diagonals
-        kingDirections = [(-1, 0), (0, 1), (1, 0), (0, -1),
-                          (-1, -1), (-1, 1), (1, 1), (1, -1)]
+        kingDirections = SLIDER_DIRECTIONS["Q"]
 
         # this loop will check for all potential pins and checks
         # from all pieces EXCEPT knights (done after for loop)
-        for i, direction in enumerate(kingDirections):
+        for i, ray in enumerate(RAYS[startRow][startCol]):
+            direction = kingDirections[i]
             potentialPin = ()  # placeholder variable for a potential pin
-            for distance in range(1, 8):
-                # check all pieces in the given direction
-                endRow = startRow + direction[0] * distance
-                endCol = startCol + direction[1] * distance
-
-                # if the square is on the board...
-                if -1 < endRow < 8 and -1 < endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-
-                    # ...and there's a piece there...
-                    if endPiece:
-                        # ... and it's an ally piece ...
-                        if endPiece[0] == allyColor:
-                            # ... and it is NOT the king
-                            # (We need to add the king condition because the get_king_moves() function calls this after placing
-                            # a "phantom" king to test for any potential checks if the move was made.
-                            # We need to make sure that when this call is made that we aren't "protecting" our phantom king)
-                            if endPiece[1] != "K":
-                                if not potentialPin:
-                                    # if there hasn't been a pin yet, save it!
-                                    potentialPin = (
-                                        endRow, endCol, direction[0], direction[1])
-                                else:
-                                    # otherwise, there's really no pin if we already ahve a "potential pin";
-                                    # we have multiple layers of protection and can break out of this direction and move onto the next one
-                                    break
-                        else:
-                            # But if it's an enemy piece...
-                            # there are 6 potential enemy pieces that could be putting it into check:
-                            # 1) could be a rook (orthogonal)
-                            # 2) could be a bishop (diagonal)
-                            # 3) could be a queen (anywhere)
-                            # 4) could be a (white) pawn attacking upward
-                            # 5) could be a (black) pawn attacking downwward
-                            # 6) could be a knight (8 positions)
-
-                            pieceType = endPiece[1]
-
-                            # we will loop through all the directions and match them
-                            # up with the appropriate piece to identify potential pin
-                            # Note: The direction of the pawn movements are TOWARD the king, not away from him
-                            if (0 <= i <= 3 and pieceType == "R") or \
-                                (4 <= i <= 7 and pieceType == "B") or \
-                                (pieceType == "Q") or \
-                                (distance == 1 and pieceType == "P" and allyColor == "b" and (i == 6 or i == 7)) or \
-                                (distance == 1 and pieceType == "P" and enemyColor == "w" and (i == 4 or i == 5)) or \
-                                    (distance == 1 and pieceType == "K"):
-                                if not potentialPin:
-                                    # since there was no possible pin blocking this,
-                                    # it must be a direct check
-                                    inCheck = True
-                                    checks.append(
-                                        (endRow, endCol, direction[0], direction[1]))
-                                else:
-                                    # if there was a possible pin, we will  append it to actual pins
-                                    # because it is clearly blocking a check
-                                    pins.append(potentialPin)
-
-                                break
+            # check all squares in the given direction, up to the edge of the board
+            for distance, (endRow, endCol, bit) in enumerate(ray, 1):
+                endPiece = board[endRow][endCol]
+
+                # if there's a piece there...
+                if endPiece:
+                    # ... and it's an ally piece ...
+                    if endPiece[0] == allyColor:
+                        # ... and it is NOT the king
+                        # (only relevant when the king position is moved without moving the king on the board,
+                        # as the old get_king_moves did: the king must not "protect" itself)
+                        if endPiece[1] != "K":
+                            if not potentialPin:
+                                # if there hasn't been a pin yet, save it!
+                                potentialPin = (
+                                    endRow, endCol, direction[0], direction[1])
                             else:
-                                # there is no check from the opponent
+                                # otherwise, there's really no pin if we already ahve a "potential pin";
+                                # we have multiple layers of protection and can break out of this direction and move onto the next one
                                 break
-                else:
-                    # we are off the board
-                    break
+                    else:
+                        # But if it's an enemy piece...
+                        # there are 6 potential enemy pieces that could be putting it into check:
+                        # 1) could be a rook (orthogonal)
+                        # 2) could be a bishop (diagonal)
+                        # 3) could be a queen (anywhere)
+                        # 4) could be a (white) pawn attacking upward
+                        # 5) could be a (black) pawn attacking downwward
+                        # 6) could be a knight (8 positions)
+
+                        pieceType = endPiece[1]
+
+                        # we will loop through all the directions and match them
+                        # up with the appropriate piece to identify potential pin
+                        # Note: The direction of the pawn movements are TOWARD the king, not away from him
+                        if (0 <= i <= 3 and pieceType == "R") or \
+                            (4 <= i <= 7 and pieceType == "B") or \
+                            (pieceType == "Q") or \
+                            (distance == 1 and pieceType == "P" and allyColor == "b" and (i == 6 or i == 7)) or \
+                            (distance == 1 and pieceType == "P" and allyColor == "w" and (i == 4 or i == 5)) or \
+                                (distance == 1 and pieceType == "K"):
+                            if not potentialPin:
+                                # since there was no possible pin blocking this,
+                                # it must be a direct check
+                                inCheck = True
+                                checks.append(
+                                    (endRow, endCol, direction[0], direction[1]))
+                            else:
+                                # if there was a possible pin, we will  append it to actual pins
+                                # because it is clearly blocking a check
+                                pins.append(potentialPin)
+
+                            break
+                        else:
+                            # there is no check from the opponent
+                            break
 
         # find any knight checks
         # note: there can NOT be any knight pins
-        knightJumps = [(-2, 1), (-1, 2), (1, 2), (2, 1),
-                       (2, -1), (1, -2), (-1, -2), (-2, -1)]
-        for x, y in knightJumps:
-            endRow = startRow + x
-            endCol = startCol + y
-
-            if -1 < endRow < 8 and -1 < endCol < 8:  # make sure we're on the board
-                endPiece = self.board[endRow][endCol]
-                # make sure piece is an enemy knight
-                if endPiece and endPiece[0] == enemyColor and endPiece[1] == "N":
-                    inCheck = True
-                    checks.append((endRow, endCol, x, y))
+        for endRow, endCol, bit in KNIGHT_TARGETS[startRow][startCol]:
+            endPiece = board[endRow][endCol]
+            # make sure piece is an enemy knight
+            if endPiece and endPiece[0] == enemyColor and endPiece[1] == "N":
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
 
         return inCheck, pins, checks
 
-    def get_valid_moves(self):
-        """Generates valid moves only. """
-        validMoves = []
+    def update_legality_masks(self):
+        """
+        Works out once per position what the move generators need to know about the safety of our king,
+        so that each of them can check a move with a single bit test:
+        1) checkMask: the squares a piece other than the king may move to. These are all squares when not in check,
+        the checking piece and the squares between it and the king in a single check, and none in a double check.
+        2) pinMasks: for every pinned piece (by square), the squares between the king and the pinning piece
+        (the pinning piece included), the only ones the pinned piece may move to.
+        3) attackMap: the squares attacked by the opponent, which the king may not move to.
+        Square [i][j] is bit i * 8 + j of a mask.
+        """
+        self.boardRows = self.get_board_rows()
         self.inCheck, self.pins, self.checks = self.find_pins_and_checks()
+        kingRow, kingCol = self.whiteKingPosition if self.whiteToMove else self.blackKingPosition
+
+        self.pinMasks = {}
+        for pinRow, pinCol, x, y in self.pins:
+            self.pinMasks[pinRow * 8 + pinCol] = self.get_ray_mask(kingRow, kingCol, x, y)
+
+        if not self.checks:
+            self.checkMask = FULL_MASK
+        elif len(self.checks) == 1:
+            checkRow, checkCol, x, y = self.checks[0]
+            if self.board[checkRow][checkCol][1] == "N":
+                # a knight's check can not be blocked, only the knight captured
+                self.checkMask = 1 << (checkRow * 8 + checkCol)
+            else:
+                self.checkMask = self.get_ray_mask(kingRow, kingCol, x, y)
+        else:
+            self.checkMask = 0  # in a double check only the king can move
 
-        kingRow = self.whiteKingPosition[0] if self.whiteToMove else self.blackKingPosition[0]
-        kingCol = self.whiteKingPosition[1] if self.whiteToMove else self.blackKingPosition[1]
+        self.attackMap = self.get_attack_map()
 
-        if self.inCheck:
-            # if there is a check, we need to be very clear about what moves are valid
-            if len(self.checks) == 1:
-                # in this case, there is a single check
-                # when there is a single check, the king may move, or we can block the check, or capture the piece
-                moves = self.get_all_possible_moves()
-                checkRow, checkCol, checkDirectionX, checkDirectionY = self.checks[0]
-                pieceChecking = self.board[checkRow][checkCol]
-
-                # squares that pieces (apart from the king) can move to
-                movesThatBlockCheck = []
-
-                # king must be moved or knight must be captured
-                if pieceChecking[1] == "N":
-                    movesThatBlockCheck.append((checkRow, checkCol))
+    def get_board_rows(self):
+        """
+        Returns the board as plain nested lists, which the move generators read instead of self.board
+        since indexing a NumPy array is several times slower than indexing a list.
+        """
+        return self.board.tolist() if isinstance(self.board, np.ndarray) else self.board
+
+    def get_ray_mask(self, i, j, x, y):
+        """Returns the mask of the squares from [i][j] in direction (x, y), up to and including the first enemy piece. """
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.boardRows
+        mask = 0
+        for r, c, bit in RAYS[i][j][DIRECTION_INDEX[(x, y)]]:
+            mask |= bit
+            if board[r][c] and board[r][c][0] == enemyColor:
+                break
+        return mask
+
+    def get_attack_map(self):
+        """
+        Returns the mask of all squares attacked by the opponent of the side to move.
+        Our king is taken off the board meanwhile: a rook checking the king along a row also attacks
+        the square behind the king, which would otherwise look like a safe square to step back to.
+        """
+        board = self.boardRows
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingRow, kingCol = self.whiteKingPosition if self.whiteToMove else self.blackKingPosition
+        king = board[kingRow][kingCol]
+        board[kingRow][kingCol] = ""
+
+        # pawns attack forward diagonally, which is down the board for black and up for white
+        pawnDirection = 1 if enemyColor == "b" else -1
+        attacked = 0
+        for i in range(8):
+            row = board[i]
+            for j in range(8):
+                piece = row[j]
+                if not piece or piece[0] != enemyColor:
+                    continue
+                pieceType = piece[1]
+                if pieceType == "P":
+                    r = i + pawnDirection
+                    if -1 < r < 8:
+                        if j > 0:
+                            attacked |= 1 << (r * 8 + j - 1)
+                        if j < 7:
+                            attacked |= 1 << (r * 8 + j + 1)
+                elif pieceType == "N" or pieceType == "K":
+                    for r, c, bit in (KNIGHT_TARGETS if pieceType == "N" else KING_TARGETS)[i][j]:
+                        attacked |= bit
                 else:
-                    for i in range(1, 8):
-                        square = (kingRow + checkDirectionX * i,
-                                  kingCol + checkDirectionY * i)
-                        movesThatBlockCheck.append(square)
-                        if square[0] == checkRow and square[1] == checkCol:
-                            break
+                    for ray in RAYS[i][j][SLIDER_RAYS[pieceType]]:
+                        for r, c, bit in ray:
+                            attacked |= bit
+                            if board[r][c]:
+                                break  # the first piece in the way is attacked, but blocks the rest of the line
 
-                for move in moves:
-                    if move.pieceMoved[1] == "K":
-                        # if the king moved, he is not blocking the check but escaping it. this is valid
-                        validMoves.append(move)
-                    else:
-                        # if it's not the king that was moved,
-                        # then the piece that did move must be one of the moves that blocks the check
-                        if (move.endRow, move.endCol) in movesThatBlockCheck:
-                            validMoves.append(move)
+        board[kingRow][kingCol] = king
+        return attacked
 
-            else:
-                # in this case, there is a double check
-                # when there is a double check, the king must move no matter what
-                self.get_king_moves(kingRow, kingCol, validMoves)
+    def get_valid_moves(self, moves=None):
+        """
+        Returns the valid moves of the position, and sets the inCheck, checkmate and stalemate flags.
+        A list can be passed in as `moves` to be emptied and refilled instead of building a new one,
+        so that callers generating moves over and over (e.g. once per ply of a search) reuse their lists.
+        If the state has a moveCache, positions seen before are answered from it instead of generating the moves;
+        the caller always gets a list of its own, so it may change it (e.g. shuffle it).
+        """
+        moveCache = self.moveCache
+        if moveCache is None:
+            return self.generate_valid_moves(moves)
+
+        key = self.zobristKeyLog[-1]
+        entry = moveCache.get(key)
+        if entry is None:
+            moves = self.generate_valid_moves(moves)
+            moveCache.put(key, moves, self.inCheck, self.checkmate, self.stalemate)
+            return moves
+
+        cachedMoves, self.inCheck, self.checkmate, self.stalemate = entry
+        if moves is None:
+            return list(cachedMoves)
+        moves[:] = cachedMoves
+        return moves
+
+    def generate_valid_moves(self, moves=None):
+        """Generates valid moves only (see get_valid_moves, which also consults the move cache). """
+        if moves is None:
+            moves = []
         else:
-            # if there is no check, anything goes
-            # (pins are dealt with in the get<piece>Moves functions)
-            validMoves = self.get_all_possible_moves()
-
-            # since we are not in check, we also need castling moves
-            allyColor = "w" if self.whiteToMove else "b"
-            if self.whiteToMove:
-                # white castling moves
-                self.get_castling_moves(
-                    self.whiteKingPosition[0], self.whiteKingPosition[1], validMoves, allyColor)
-            else:
-                # black castling moves
-                self.get_castling_moves(
-                    self.blackKingPosition[0], self.blackKingPosition[1], validMoves, allyColor)
+            moves.clear()
+        validMoves = moves
+        self.update_legality_masks()
+
+        if len(self.checks) > 1:
+            # in this case, there is a double check
+            # when there is a double check, the king must move no matter what
+            kingRow, kingCol = self.whiteKingPosition if self.whiteToMove else self.blackKingPosition
+            self.get_king_moves(kingRow, kingCol, validMoves)
+        else:
+            # the generators only make moves onto the check mask (blocking or capturing a single checking piece),
+            # and keep pinned pieces on the line of their pin (see update_legality_masks)
+            self.get_all_possible_moves(validMoves)
+
+            # if we are not in check, we also need castling moves
+            if not self.inCheck:
+                allyColor = "w" if self.whiteToMove else "b"
+                if self.whiteToMove:
+                    # white castling moves
+                    self.get_castling_moves(
+                        self.whiteKingPosition[0], self.whiteKingPosition[1], validMoves, allyColor)
+                else:
+                    # black castling moves
+                    self.get_castling_moves(
+                        self.blackKingPosition[0], self.blackKingPosition[1], validMoves, allyColor)
 
         # set checkmate if you are in check and there are no moves, and
         # set stalement if you are not in check but there are no moves.
@@ -745,16 +1092,326 @@ class State():
 
         return validMoves
 
-    def get_all_possible_moves(self):
-        """Generates all possible moves. """
-        moves = []
+    def get_valid_captures(self, moves=None):
+        """
+        Generates the valid captures and promotions only, without generating any quiet move (e.g. for a quiescence
+        search). When in check every valid move is generated instead, as the side to move has to escape the check
+        anyway, which also keeps checkmate detection. Otherwise stalemate can not be told from the captures alone,
+        so checkmate and stalemate are both left unset.
+        """
+        self.update_legality_masks()
+        if self.inCheck:
+            return self.get_valid_moves(moves)
+
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        self.checkmate = False
+        self.stalemate = False
+
+        enemyColor = "b" if self.whiteToMove else "w"
+        allyColor = "w" if self.whiteToMove else "b"
+        board = self.boardRows
 
         for i in range(8):
             for j in range(8):
-                if self.board[i][j]:
-                    if (self.board[i][j][0] == "w" and self.whiteToMove) or \
-                            (self.board[i][j][0] == "b" and not self.whiteToMove):
-                        piece = self.board[i][j][1]
+                piece = board[i][j]
+                if not piece or piece[0] != allyColor:
+                    continue
+                # squares this piece may move to: only along the line of its pin if it is pinned
+                allowed = self.pinMasks.get(i * 8 + j, FULL_MASK)
+                if piece[1] == "P":
+                    self.get_pawn_captures(i, j, moves, allowed)
+                elif piece[1] == "N" or piece[1] == "K":
+                    for r, c, bit in (KNIGHT_TARGETS if piece[1] == "N" else KING_TARGETS)[i][j]:
+                        if board[r][c] and board[r][c][0] == enemyColor:
+                            # the king may not capture a defended piece
+                            if allowed & bit and not (piece[1] == "K" and self.attackMap & bit):
+                                moves.append(Move((i, j), (r, c), board))
+                else:
+                    for ray in RAYS[i][j][SLIDER_RAYS[piece[1]]]:
+                        for r, c, bit in ray:
+                            if board[r][c]:
+                                # the first piece in this direction is the only one that can be captured
+                                if board[r][c][0] == enemyColor and allowed & bit:
+                                    moves.append(Move((i, j), (r, c), board))
+                                break
+
+        return moves
+
+    def get_legality_masks(self):
+        """Returns what the last update_legality_masks worked out, to hand to get_valid_quiet_moves later. """
+        return self.boardRows, self.inCheck, self.pins, self.checks, self.checkMask, self.pinMasks, self.attackMap
+
+    def get_valid_quiet_moves(self, moves=None, masks=None):
+        """
+        Generates the valid moves that neither capture nor promote (castling included), i.e. the ones
+        get_valid_captures leaves out, straight onto the empty squares the legality masks allow
+        (see update_legality_masks). Checkmate and stalemate are left unset.
+        masks (from get_legality_masks, taken in the same position) saves working the legality masks out again,
+        which costs more than generating the quiet moves.
+        """
+        if masks is None:
+            self.update_legality_masks()
+        else:
+            self.boardRows, self.inCheck, self.pins, self.checks, self.checkMask, self.pinMasks, self.attackMap = masks
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        self.checkmate = False
+        self.stalemate = False
+
+        allyColor = "w" if self.whiteToMove else "b"
+        if self.whiteToMove:
+            direction, startRow, lastRow = -1, 6, 0  # white pawns move up
+        else:
+            direction, startRow, lastRow = 1, 1, 7  # black pawns move down
+        board = self.boardRows
+        # in a double check only the king may move
+        isDoubleCheck = len(self.checks) > 1
+
+        for i in range(8):
+            for j in range(8):
+                piece = board[i][j]
+                if not piece or piece[0] != allyColor:
+                    continue
+                if piece[1] == "K":
+                    for r, c, bit in KING_TARGETS[i][j]:
+                        if not board[r][c] and not self.attackMap & bit:
+                            moves.append(Move((i, j), (r, c), board))
+                    continue
+                if isDoubleCheck:
+                    continue
+                # squares this piece may move to: along the line of its pin, and onto the check mask
+                # (a knight jump never stays on the line of a pin, so a pinned knight has none)
+                allowed = self.checkMask & self.pinMasks.get(i * 8 + j, FULL_MASK)
+                if not allowed:
+                    continue
+                if piece[1] == "P":
+                    r = i + direction
+                    # a push onto the last row is a promotion, which get_valid_captures generates
+                    if r != lastRow and not board[r][j]:
+                        if allowed >> (r * 8 + j) & 1:
+                            moves.append(Move((i, j), (r, j), board))
+                        if i == startRow and not board[r + direction][j] and \
+                                allowed >> ((r + direction) * 8 + j) & 1:
+                            moves.append(Move((i, j), (r + direction, j), board))
+                elif piece[1] == "N":
+                    for r, c, bit in KNIGHT_TARGETS[i][j]:
+                        if not board[r][c] and allowed & bit:
+                            moves.append(Move((i, j), (r, c), board))
+                else:
+                    for ray in RAYS[i][j][SLIDER_RAYS[piece[1]]]:
+                        for r, c, bit in ray:
+                            if board[r][c]:
+                                break
+                            if allowed & bit:
+                                moves.append(Move((i, j), (r, c), board))
+
+        if not self.inCheck:
+            kingRow, kingCol = self.whiteKingPosition if self.whiteToMove else self.blackKingPosition
+            self.get_castling_moves(kingRow, kingCol, moves, allyColor)
+        return moves
+
+    def get_staged_moves(self, hashMove=None, killers=(), orderKey=None):
+        """
+        Yields the valid moves in stages, each stage only being generated once the previous ones are used up:
+        1) the hash move (e.g. the best move an earlier search of the position found), if it is valid
+        2) captures and promotions (every valid move when in check)
+        3) killer moves (quiet moves that caused a cutoff elsewhere), if they are valid here
+        4) the remaining quiet moves
+        A search that cuts off on an early move never pays for generating the quiet moves, and the quiet moves
+        reuse the legality masks the captures were generated with.
+        orderKey, if given, sorts the captures and the quiet moves (highest first).
+        Once every move has been yielded, checkmate and stalemate are set as by get_valid_moves.
+        """
+        # the position is changed (and restored) by the caller between two yields,
+        # so anything read from it is read before the first yield of a stage
+        count = 0
+        if hashMove is not None:
+            if self.is_valid_move(hashMove):
+                count += 1
+                yield hashMove
+            else:
+                hashMove = None
+
+        captures = self.get_valid_captures()
+        inCheck = self.inCheck
+        masks = self.get_legality_masks()  # still those of this position once the captures have been searched
+        if orderKey is not None:
+            captures.sort(key=orderKey, reverse=True)
+        for move in captures:
+            if move != hashMove:
+                count += 1
+                yield move
+
+        # when in check, the captures already were every valid move
+        if not inCheck:
+            triedKillers = []
+            for move in killers:
+                if move != hashMove and move not in triedKillers and not move.pieceCaptured and \
+                        not move.isPawnPromotion and self.is_valid_move(move):
+                    triedKillers.append(move)
+                    count += 1
+                    yield move
+
+            quietMoves = self.get_valid_quiet_moves(masks=masks)
+            if orderKey is not None:
+                quietMoves.sort(key=orderKey, reverse=True)
+            for move in quietMoves:
+                if move != hashMove and move not in triedKillers:
+                    count += 1
+                    yield move
+
+        self.checkmate = count == 0 and inCheck
+        self.stalemate = count == 0 and not inCheck
+
+    def get_move(self, moveID):
+        """
+        Builds the Move a Move.moveID stands for in this position (e.g. a best move the transposition table stored
+        as its id), with the en passant and castling flags worked out from the board. The move is not checked:
+        pass it to is_valid_move before playing it.
+        """
+        start, end = moveID & 0x3F, moveID >> 6 & 0x3F
+        startRow, startCol, endRow, endCol = start >> 3, start & 7, end >> 3, end & 7
+        board = self.board
+        pieceMoved = board[startRow][startCol]
+        # a king moving two columns is castling, a pawn moving to another column onto an empty square captures en passant
+        isCastleMove = pieceMoved[1:] == "K" and abs(endCol - startCol) == 2
+        isEnPassantMove = pieceMoved[1:] == "P" and startCol != endCol and not board[endRow][endCol]
+        return Move((startRow, startCol), (endRow, endCol), board, isEnPassantMove, isCastleMove,
+                    PROMOTION_CHOICES[moveID >> 12])
+
+    def is_valid_move(self, move):
+        """
+        Determine if a move (e.g. one remembered from another position) is valid in this position,
+        without generating the other moves: the pieces must match, the move must be one the piece can make,
+        and it must not leave our king in check.
+        """
+        board = self.board
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        if board[move.startRow][move.startCol] != move.pieceMoved or move.pieceMoved[0] != allyColor:
+            return False
+
+        if move.isCastleMove:
+            castlingMoves = []
+            self.get_castling_moves(move.startRow, move.startCol, castlingMoves, allyColor)
+            return move in castlingMoves
+        if move.isEnPassantMove:
+            if (move.endRow, move.endCol) != self.enPassantSquare or \
+                    board[move.startRow][move.endCol] != enemyColor + "P":
+                return False
+        elif board[move.endRow][move.endCol] != move.pieceCaptured or move.pieceCaptured[:1] == allyColor:
+            return False
+
+        rowStep = move.endRow - move.startRow
+        colStep = move.endCol - move.startCol
+        pieceType = move.pieceMoved[1]
+        if pieceType == "P":
+            direction = -1 if self.whiteToMove else 1
+            if move.pieceCaptured:
+                if rowStep != direction or abs(colStep) != 1:
+                    return False
+            elif colStep != 0:
+                return False
+            elif rowStep == 2 * direction:
+                # a double push, from the starting row and over an empty square
+                if move.startRow != (6 if self.whiteToMove else 1) or board[move.startRow + direction][move.startCol]:
+                    return False
+            elif rowStep != direction:
+                return False
+        elif pieceType == "N":
+            if (abs(rowStep), abs(colStep)) not in ((1, 2), (2, 1)):
+                return False
+        elif pieceType == "K":
+            if max(abs(rowStep), abs(colStep)) != 1:
+                return False
+        else:
+            # sliders must move along one of their directions, over empty squares only
+            x = (rowStep > 0) - (rowStep < 0)
+            y = (colStep > 0) - (colStep < 0)
+            if (rowStep and colStep and abs(rowStep) != abs(colStep)) or (x, y) not in SLIDER_DIRECTIONS[pieceType]:
+                return False
+            for distance in range(1, max(abs(rowStep), abs(colStep))):
+                if board[move.startRow + x * distance][move.startCol + y * distance]:
+                    return False
+
+        # finally, play the move and see if it leaves our king under attack
+        self.make_move(move)
+        self.whiteToMove = not self.whiteToMove
+        isExposed = self.is_in_check()
+        self.whiteToMove = not self.whiteToMove
+        self.undo_move()
+        return not isExposed
+
+    def get_pawn_captures(self, i, j, moves, allowed):
+        """Adds the captures (en passant included) and promotions of the pawn on [i][j], onto the allowed squares. """
+        direction = -1 if self.whiteToMove else 1
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.boardRows
+        r = i + direction
+
+        # promotions without a capture
+        if (r == 0 or r == 7) and not board[r][j] and allowed >> (r * 8 + j) & 1:
+            self.add_pawn_move((i, j), (r, j), moves, board)
+
+        for c in (j - 1, j + 1):
+            if -1 < c < 8:
+                if board[r][c] and board[r][c][0] == enemyColor:
+                    if allowed >> (r * 8 + c) & 1:
+                        self.add_pawn_move((i, j), (r, c), moves, board)
+                elif (r, c) == self.enPassantSquare and self.is_en_passant_safe(i, j, r, c):
+                    moves.append(Move((i, j), (r, c), board, isEnPassantMove=True))
+
+    def perft(self, depth, buffers=None):
+        """
+        Performance test: counts the leaf positions reached by playing every valid move up to the given depth.
+        The counts of many positions are well known, which makes this the standard test of a move generator
+        (and, timed, of how fast make_move / undo_move / get_valid_moves are).
+        Every depth reuses the same move list (buffers[depth]) for all the positions it visits.
+        """
+        if depth == 0:
+            return 1
+        if buffers is None:
+            buffers = [[] for _ in range(depth + 1)]
+        validMoves = self.get_valid_moves(buffers[depth])
+        if depth == 1:
+            return len(validMoves)
+
+        nodes = 0
+        for move in validMoves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1, buffers)
+            self.undo_move()
+        return nodes
+
+    def divide(self, depth):
+        """Runs perft for every valid move separately, returning the counts by move (e.g. {"e2e4": 600, ...}). """
+        counts = {}
+        for move in self.get_valid_moves():
+            self.make_move(move)
+            counts[move.get_uci_notation()] = self.perft(depth - 1)
+            self.undo_move()
+        return counts
+
+    def get_all_possible_moves(self, moves=None):
+        """
+        Generates all possible moves (appending them to `moves`, if given),
+        within the masks of the last update_legality_masks.
+        """
+        if moves is None:
+            moves = []
+
+        allyColor = "w" if self.whiteToMove else "b"
+        for i in range(8):
+            row = self.boardRows[i]
+            for j in range(8):
+                if row[j]:
+                    if row[j][0] == allyColor:
+                        piece = row[j][1]
                         if piece == "P":
                             self.get_pawn_moves(i, j, moves)
                         elif piece == "R":
@@ -771,6 +1428,11 @@ class State():
         return moves
 
 
+# promotion choices packed into 3 bits of Move.moveID ("" when the move is not a promotion)
+PROMOTION_CODES = {"": 0, "Q": 1, "R": 2, "B": 3, "N": 4}
+PROMOTION_CHOICES = {code: choice for choice, code in PROMOTION_CODES.items()}
+
+
 class Move():
     """
     Creates move instances that contain information about:
@@ -780,9 +1442,15 @@ class Move():
     4) what piece it captured
     5) if it was en passant
     6) if it was a castle
+    7) if it was a pawn promotion, and to which piece
+    Moves are created by the thousand during a search, so they use __slots__ (no per-instance __dict__)
+    and carry a precomputed integer id that makes comparing and hashing them a single integer operation.
     """
 
-    def __init__(self, startSq, endSq, board, isEnPassantMove=False, isCastleMove=False):
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured",
+                 "isEnPassantMove", "isCastleMove", "isPawnPromotion", "promotionChoice", "moveID")
+
+    def __init__(self, startSq, endSq, board, isEnPassantMove=False, isCastleMove=False, promotionChoice="Q"):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
@@ -797,20 +1465,37 @@ class Move():
 
         self.isCastleMove = isCastleMove
 
+        # a pawn reaching the final row is promoted to promotionChoice ("Q", "R", "B" or "N"),
+        # which defaults to a queen so that a move built from two clicks promotes to a queen
+        self.isPawnPromotion = (self.pieceMoved == "wP" and self.endRow == 0) or \
+            (self.pieceMoved == "bP" and self.endRow == 7)
+        self.promotionChoice = promotionChoice if self.isPawnPromotion else ""
+
+        # the move packed into one int: 6 bits for each square and 3 bits for the promotion choice
+        # (the other flags follow from the position, so two moves of one position differ in these only)
+        self.moveID = (self.startRow * 8 + self.startCol) | (self.endRow * 8 + self.endCol) << 6 | \
+            PROMOTION_CODES[self.promotionChoice] << 12
+
+    def get_uci_notation(self):
+        """Returns the move in the long algebraic notation used by UCI (e.g. "e2e4", or "e7e8q" for a promotion). """
+        files = "abcdefgh"
+        return files[self.startCol] + str(8 - self.startRow) + \
+            files[self.endCol] + str(8 - self.endRow) + self.promotionChoice.lower()
+
     def __eq__(self, other):
         """
         Overriding equal so we can more easily compare two move objects.
-        We need to compare our starting and ending position (x and y coordinates)
-        to the starting and ending postion of the possible valid move we're comparing it to.
-        Since they are both lists, we can not simply check equality regularly
+        Two moves are equal if they have the same starting and ending positions and promotion choice,
+        which is exactly what the move id packs together (so e.g. a move built from two clicks matches a valid move).
         """
         if isinstance(other, Move):
-            return self.startRow == other.startRow and \
-                self.endRow == other.endRow and \
-                self.startCol == other.startCol and \
-                self.endCol == other.endCol
+            return self.moveID == other.moveID
         return False  # not sure why this is here
 
+    def __hash__(self):
+        """Moves that are equal have the same id, so it doubles as the hash (e.g. for sets and dictionary keys). """
+        return self.moveID
+
 
 class CastlingRights():
     """ 
@@ -826,3 +1511,7 @@ class CastlingRights():
         self.whiteQueenSide = whiteQueenSide
         self.blackKingSide = blackKingSide
         self.blackQueenSide = blackQueenSide
+
+    def index(self):
+        """Packs the 4 rights into a number from 0 to 15 (used to look up their Zobrist keys). """
+        return self.whiteKingSide | self.whiteQueenSide << 1 | self.blackKingSide << 2 | self.blackQueenSide << 3
@@ -0,0 +1,242 @@
+# piece values and piece-square tables used to evaluate positions
+#
+# A note on the tables:
+# - every table is written from white's point of view, row 0 being black's back rank (the same as State.board),
+# so a black piece on [i][j] uses the value on [7 - i][j]
+# - values are in centipawns (a pawn is worth 100), and positive scores favour white
+# - the middlegame and endgame tables are blended by the game phase (how much material is left),
+# so that e.g. the king hides in the middlegame but walks to the centre in the endgame (a "tapered" evaluation)
+import numpy as np
+
+# value of each piece type, in centipawns
+PIECE_VALUES = {"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+# number of points per piece type, used for the plain material count (move_finder.PIECE_POINTS)
+PIECE_POINTS = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 0}
+
+# how much each piece type counts toward the game phase; all pieces on the board add up to MAX_PHASE
+PHASE_WEIGHTS = {"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+MAX_PHASE = 24
+
+PAWN_TABLE = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [10, 10, 20, 30, 30, 20, 10, 10],
+    [5, 5, 10, 25, 25, 10, 5, 5],
+    [0, 0, 0, 20, 20, 0, 0, 0],
+    [5, -5, -10, 0, 0, -10, -5, 5],
+    [5, 10, 10, -20, -20, 10, 10, 5],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+]
+
+# in the endgame pawns are worth more the closer they are to promoting
+PAWN_ENDGAME_TABLE = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [80, 80, 80, 80, 80, 80, 80, 80],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [30, 30, 30, 30, 30, 30, 30, 30],
+    [20, 20, 20, 20, 20, 20, 20, 20],
+    [10, 10, 10, 10, 10, 10, 10, 10],
+    [10, 10, 10, 10, 10, 10, 10, 10],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+]
+
+KNIGHT_TABLE = [
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+    [-40, -20, 0, 0, 0, 0, -20, -40],
+    [-30, 0, 10, 15, 15, 10, 0, -30],
+    [-30, 5, 15, 20, 20, 15, 5, -30],
+    [-30, 0, 15, 20, 20, 15, 0, -30],
+    [-30, 5, 10, 15, 15, 10, 5, -30],
+    [-40, -20, 0, 5, 5, 0, -20, -40],
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+]
+
+BISHOP_TABLE = [
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 10, 10, 5, 0, -10],
+    [-10, 5, 5, 10, 10, 5, 5, -10],
+    [-10, 0, 10, 10, 10, 10, 0, -10],
+    [-10, 10, 10, 10, 10, 10, 10, -10],
+    [-10, 5, 0, 0, 0, 0, 5, -10],
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+]
+
+ROOK_TABLE = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, 10, 10, 10, 10, 5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [0, 0, 0, 5, 5, 0, 0, 0],
+]
+
+QUEEN_TABLE = [
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 5, 5, 5, 0, -10],
+    [-5, 0, 5, 5, 5, 5, 0, -5],
+    [0, 0, 5, 5, 5, 5, 0, -5],
+    [-10, 5, 5, 5, 5, 5, 0, -10],
+    [-10, 0, 5, 0, 0, 0, 0, -10],
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+]
+
+# in the middlegame the king should stay behind its pawns, castled
+KING_TABLE = [
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-20, -30, -30, -40, -40, -30, -30, -20],
+    [-10, -20, -20, -20, -20, -20, -20, -10],
+    [20, 20, 0, 0, 0, 0, 20, 20],
+    [20, 30, 10, 0, 0, 10, 30, 20],
+]
+
+# in the endgame the king is a strong piece and belongs in the centre
+KING_ENDGAME_TABLE = [
+    [-50, -40, -30, -20, -20, -30, -40, -50],
+    [-30, -20, -10, 0, 0, -10, -20, -30],
+    [-30, -10, 20, 30, 30, 20, -10, -30],
+    [-30, -10, 30, 40, 40, 30, -10, -30],
+    [-30, -10, 30, 40, 40, 30, -10, -30],
+    [-30, -10, 20, 30, 30, 20, -10, -30],
+    [-30, -30, 0, 0, 0, 0, -30, -30],
+    [-50, -30, -30, -30, -30, -30, -30, -50],
+]
+
+MIDDLEGAME_PIECE_TABLES = {"P": PAWN_TABLE, "N": KNIGHT_TABLE, "B": BISHOP_TABLE,
+                           "R": ROOK_TABLE, "Q": QUEEN_TABLE, "K": KING_TABLE}
+ENDGAME_PIECE_TABLES = {"P": PAWN_ENDGAME_TABLE, "N": KNIGHT_TABLE, "B": BISHOP_TABLE,
+                        "R": ROOK_TABLE, "Q": QUEEN_TABLE, "K": KING_ENDGAME_TABLE}
+
+
+def _build_scores(pieceTables):
+    """
+    Flattens the tables into one list of 64 scores per piece string (e.g. "wN"), with the piece value included
+    and the sign already applied (positive for white, negative for black), so updating a score is a single addition.
+    """
+    scores = {}
+    for pieceType, table in pieceTables.items():
+        value = PIECE_VALUES[pieceType]
+        scores["w" + pieceType] = [value + table[sq // 8][sq % 8] for sq in range(64)]
+        scores["b" + pieceType] = [-(value + table[7 - sq // 8][sq % 8]) for sq in range(64)]
+    return scores
+
+
+MIDDLEGAME_SCORES = _build_scores(MIDDLEGAME_PIECE_TABLES)
+ENDGAME_SCORES = _build_scores(ENDGAME_PIECE_TABLES)
+# signed material and phase weight of every piece string
+MATERIAL = {color + pieceType: (points if color == "w" else -points)
+            for color in "wb" for pieceType, points in PIECE_POINTS.items()}
+PHASE = {color + pieceType: weight for color in "wb" for pieceType, weight in PHASE_WEIGHTS.items()}
+
+
+def evaluate_board(board):
+    """
+    Computes the evaluation terms of a board from scratch, as a tuple of
+    (material, middlegame score, endgame score, phase). State keeps these up to date incrementally.
+    """
+    material = middlegame = endgame = phase = 0
+    for i in range(8):
+        for j in range(8):
+            piece = board[i][j]
+            if piece:
+                material += MATERIAL[piece]
+                middlegame += MIDDLEGAME_SCORES[piece][i * 8 + j]
+                endgame += ENDGAME_SCORES[piece][i * 8 + j]
+                phase += PHASE[piece]
+    return material, middlegame, endgame, phase
+
+
+def tapered_score(middlegame, endgame, phase):
+    """Blends the middlegame and endgame scores by the phase (MAX_PHASE = all pieces on the board), in centipawns. """
+    # promotions can push the phase above its starting value
+    phase = min(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) / MAX_PHASE
+
+
+# Batch evaluation
+# Many positions (e.g. for offline analysis or labelling training data) can be scored at once with NumPy, from
+# one of two encodings of their boards:
+# - squares: an (N, 64) integer array holding the code of the piece on each square (0 for an empty square,
+# PIECE_CODES otherwise), square [i][j] being i * 8 + j as in State.board
+# - planes: an (N, 12, 8, 8) array of 0s and 1s with one plane per piece string (in PIECE_ORDER),
+# plane k being 1 wherever piece PIECE_ORDER[k] stands
+
+PIECE_ORDER = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECE_ORDER, 1)}
+PIECE_CODES[""] = 0
+
+
+def _build_batch_terms():
+    """
+    Stacks the evaluation terms of every piece on every square into a (13, 64, 4) array, the last axis holding
+    (material, middlegame score, endgame score, phase) in the order evaluate_board returns them.
+    Row 0 (an empty square) is all zeros, so a board in the squares encoding can index it directly.
+    """
+    terms = np.zeros((len(PIECE_ORDER) + 1, 64, 4), dtype=np.int32)
+    for piece, code in PIECE_CODES.items():
+        if piece:
+            terms[code, :, 0] = MATERIAL[piece]
+            terms[code, :, 1] = MIDDLEGAME_SCORES[piece]
+            terms[code, :, 2] = ENDGAME_SCORES[piece]
+            terms[code, :, 3] = PHASE[piece]
+    return terms
+
+
+BATCH_TERMS = _build_batch_terms()
+
+
+def encode_squares(states):
+    """Encodes the boards of the given states as an (N, 64) array of piece codes. """
+    codes = PIECE_CODES
+    squares = np.zeros((len(states), 64), dtype=np.int8)
+    for n, state in enumerate(states):
+        # reading the board as plain lists is much faster than indexing a NumPy array square by square
+        squares[n] = [codes[piece] for row in state.get_board_rows() for piece in row]
+    return squares
+
+
+def encode_planes(states):
+    """Encodes the boards of the given states as an (N, 12, 8, 8) array with one plane per piece. """
+    return squares_to_planes(encode_squares(states))
+
+
+def squares_to_planes(squares):
+    """Converts boards from the squares encoding to the planes encoding. """
+    codes = np.arange(1, len(PIECE_ORDER) + 1, dtype=squares.dtype)
+    planes = squares[:, np.newaxis, :] == codes[np.newaxis, :, np.newaxis]
+    return planes.astype(np.uint8).reshape(len(squares), len(PIECE_ORDER), 8, 8)
+
+
+def evaluate_batch(positions):
+    """
+    Computes the evaluation terms of many boards at once, given in either encoding, as a tuple of arrays
+    (material, middlegame score, endgame score, phase) of length N: the batch version of evaluate_board.
+    """
+    positions = np.asarray(positions)
+    if positions.ndim == 2:
+        # look up the terms of the piece on each square, and add them up over the squares
+        terms = BATCH_TERMS[positions, np.arange(64)].sum(axis=1)
+    elif positions.ndim == 4:
+        # each plane selects the squares its piece stands on
+        planes = positions.reshape(len(positions), len(PIECE_ORDER), 64)
+        terms = np.einsum("nps,pst->nt", planes.astype(np.int32), BATCH_TERMS[1:])
+    else:
+        raise ValueError("expected an (N, 64) or (N, 12, 8, 8) array, got shape {}".format(positions.shape))
+    return terms[:, 0], terms[:, 1], terms[:, 2], terms[:, 3]
+
+
+def score_batch(positions):
+    """
+    Scores many boards at once, given in either encoding, as material plus piece-square tables blended by the phase,
+    in pawns (the same score move_finder.get_incremental_score gives a position that is not checkmate or stalemate).
+    """
+    material, middlegame, endgame, phase = evaluate_batch(positions)
+    phase = np.minimum(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) / MAX_PHASE / 100
@@ -1,13 +1,22 @@
 # Handling user input and displaying the board (state of the game, i.e. State class)
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame as pg
+import book
 import engine
+import move_cache
 import move_finder
 
-pg.init()  # initializing pygame
 WIDTH = HEIGHT = 800  # pygame screen size display
 SQ_SIZE = WIDTH // 8  # each square size of the 8x8 board
 MAX_FPS = 15  # for animations only
 PIECES = {}  # global dictionary giving access to all piece images
+BOT_THINKING_TIME = 1000  # time budget of the bot's search, in milliseconds
+MOVE_CACHE_SIZE = 4096  # number of positions whose valid moves are remembered (e.g. for undo and redo)
+BOOK_PATH = "book.bin"  # opening book the bot plays from before searching, if the file exists (see book.py)
 
 
 def import_pieces():
@@ -80,12 +89,34 @@ def draw_text(screen, text):
     screen.blit(textObject, textLocation)
 
 
+def draw_thinking(screen):
+    """Draws a small indicator in the corner while the bot is searching for its move. """
+    font = pg.font.SysFont("Arial", 20, True, False)
+    textObject = font.render("Thinking...", 0, pg.Color("Black"))
+    screen.blit(textObject, (5, 5))
+
+
+def find_bot_move(state, validMoves, stopEvent, openingBook=None, ordering=None):
+    """
+    Searches for the bot's move; runs on the worker thread, on its own copy of the state.
+    Returns None if the search was stopped (e.g. by an undo or a restart).
+    """
+    botMove, _ = move_finder.get_best_move_iterative(
+        state, validMoves, BOT_THINKING_TIME, stopEvent=stopEvent, book=openingBook, ordering=ordering)
+    if stopEvent.is_set():
+        return None
+    # if there is no best move, make a random move
+    return botMove if botMove else move_finder.get_random_move(validMoves)
+
+
 def main():
     """Main function that controls screen display, imports pieces, runs the clock, and contains the event listener. """
+    pg.init()  # initializing pygame (here rather than on import, so that importing this module has no side effects)
     screen = pg.display.set_mode((WIDTH, HEIGHT))  # initialize screen
 
     clock = pg.time.Clock()  # create Clock object to track time
     state = engine.State()  # instance of State class from engine.py
+    state.moveCache = move_cache.MoveCache(MOVE_CACHE_SIZE)
     validMoves = state.get_valid_moves()  # list containing all possible valid moves
     moveMade = False  # flag if move is made
 
@@ -99,6 +130,14 @@ def main():
     whiteIsHuman = True  # True if human is playing white, else False if bot
     blackIsHuman = True  # True if human is playing black, else False if bot
 
+    # the bot searches on a worker thread so that the window keeps drawing and handling events meanwhile
+    executor = ThreadPoolExecutor(max_workers=1)
+    botSearch = None  # future of the search in progress, if any
+    stopSearch = threading.Event()  # set to cancel the search in progress
+    openingBook = book.OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+    # the bot's killer moves and history (see move_finder.MoveOrdering), kept from one move to the next
+    ordering = move_finder.MoveOrdering()
+
     # game event queue
     while playing:
         isHumanTurn = (state.whiteToMove and whiteIsHuman) or (
@@ -107,6 +146,7 @@ def main():
         for event in pg.event.get():
             if event.type == pg.QUIT:
                 playing = False  # when game is quit, stop drawing state.
+                stopSearch.set()
             # mouse listener
             elif event.type == pg.MOUSEBUTTONDOWN:
                 if not gameOver and isHumanTurn:
@@ -145,13 +185,20 @@ def main():
             elif event.type == pg.KEYDOWN:
                 # key listener for undo move
                 if event.key == pg.K_z:
+                    # cancel the bot's search, since it was searching the position being undone
+                    stopSearch.set()
+                    botSearch = None
                     state.undo_move()
                     # we will consider this a move made so that it will trigger validMove recalculation
                     moveMade = True
                     gameOver = False
                 # key listener for restart game
                 if event.key == pg.K_r:
+                    stopSearch.set()
+                    botSearch = None
                     state = engine.State()
+                    state.moveCache = move_cache.MoveCache(MOVE_CACHE_SIZE)
+                    ordering = move_finder.MoveOrdering()
                     validMoves = state.get_valid_moves()
                     sqClicked = ()
                     prevClicks = []
@@ -159,15 +206,22 @@ def main():
                     gameOver = False
 
         # bot will make move only if it is not a human turn, and the game is not over
-        if not gameOver and not isHumanTurn:
-            botMove = move_finder.get_best_move_min_max(state, validMoves)
-            if botMove:
-                state.make_move(botMove)
-            else:
-                # if there is no best move, make a random move
-                state.make_move(move_finder.get_random_move(validMoves))
-
-            moveMade = True
+        # (the turn is recomputed since a key press may have changed it during this frame)
+        isHumanTurn = (state.whiteToMove and whiteIsHuman) or (
+            not state.whiteToMove and blackIsHuman)
+        if not gameOver and not isHumanTurn and not moveMade:
+            if botSearch is None:
+                # start searching on a copy, so the position drawn by this loop is never touched by the search
+                stopSearch = threading.Event()
+                botSearch = executor.submit(
+                    find_bot_move, copy.deepcopy(state), list(validMoves), stopSearch, openingBook, ordering)
+            elif botSearch.done():
+                botMove = botSearch.result()
+                botSearch = None
+                if botMove:
+                    # the move was found on the copy, so play the matching move of this position
+                    state.make_move(validMoves[validMoves.index(botMove)])
+                    moveMade = True
 
         # if a move was made, generate new set of valid moves and reset flag
         if moveMade:
@@ -175,8 +229,10 @@ def main():
             moveMade = False
 
         draw_game_state(screen, state, validMoves, sqClicked)
+        if botSearch is not None:
+            draw_thinking(screen)
 
-        # if the game is in checkmate or stalemate, we need to display the appropriate message
+        # if the game is in checkmate, stalemate or drawn, we need to display the appropriate message
         if state.checkmate:
             gameOver = True
             if state.whiteToMove:
@@ -186,10 +242,21 @@ def main():
         elif state.stalemate:
             gameOver = True
             draw_text(screen, "Stalemate!")
+        elif state.is_threefold_repetition():
+            gameOver = True
+            draw_text(screen, "Draw by threefold repetition!")
+        elif state.is_fifty_move_rule():
+            gameOver = True
+            draw_text(screen, "Draw by the fifty-move rule!")
 
         clock.tick(MAX_FPS)
         pg.display.flip()  # updates the full display Surface
 
+    # don't wait for a search that was just cancelled
+    executor.shutdown(wait=False)
+    if openingBook is not None:
+        openingBook.close()
+
 
 if __name__ == "__main__":
     """
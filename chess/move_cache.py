@@ -0,0 +1,62 @@
+# the move cache remembers the valid moves of positions already seen, so that going back and forth between
+# positions (undo / redo in the GUI, or the same position reached by different move orders) does not
+# generate the same moves again
+from collections import OrderedDict
+
+
+class MoveCache():
+    """
+    Least recently used cache of valid move lists, keyed by State.zobristKey.
+
+    Each entry is a tuple of (moves, inCheck, checkmate, stalemate), the moves being kept as a tuple so that
+    no caller can change them. The key covers everything the valid moves depend on (board, side to move,
+    castling rights and en passant square), so entries never need to be invalidated by make_move or undo_move.
+    Once the cache holds `capacity` entries, the least recently used one is evicted.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+        # counters for tuning the capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __deepcopy__(self, memo):
+        """A copied State (e.g. the one the bot searches) gets an empty cache of its own. """
+        return MoveCache(self.capacity)
+
+    def get(self, key):
+        """Returns the entry stored for the key, or None if the position is not in the cache. """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, moves, inCheck, checkmate, stalemate):
+        """Stores the valid moves of a position, evicting the least recently used entry if the cache is full. """
+        self.entries[key] = (tuple(moves), inCheck, checkmate, stalemate)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Empties the cache and resets the counters. """
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns the counters as a dictionary (e.g. for printing while tuning). """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
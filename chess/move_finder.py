@@ -9,25 +9,55 @@ opponent also optimizes their moves (e.g. minimizing black score) because high s
 and low score is great for black.
 
 '''
+import os
 import random
+import time
 
-# number of points per piece type
-PIECE_POINTS = {
-    "P": 1,
-    "N": 3,
-    "B": 3,
-    "R": 5,
-    "Q": 9,
-    "K": 0
-}
+import engine
+import evaluation
+import transposition
+
+# number of points per piece type (shared with the incremental evaluation in evaluation.py)
+PIECE_POINTS = evaluation.PIECE_POINTS
 
 # setting checkmate to a very high value indicating extreme importance
 CHECKMATE = 1000
+# the alpha-beta search scores a checkmate p plies from the root as CHECKMATE - p (so that the quickest checkmate
+# scores best), and any score beyond MATE_BOUND is a checkmate
+MATE_BOUND = CHECKMATE / 2
 # setting stalemate to a netural 0 point score, rendering it desirable
 # if losing, and not desirable if winning
 STALEMATE = 0
+# score of a draw by repetition or by the fifty-move rule
+DRAW = 0
 # recursive call depth
 MAX_DEPTH = 2
+# default depth of the alpha-beta search, which prunes enough to look further ahead
+ALPHA_BETA_DEPTH = 4
+# default time budget (in milliseconds) of the iterative deepening search
+TIME_LIMIT = 1000
+# deepest iteration the iterative deepening search will start
+MAX_ITERATION_DEPTH = 64
+# number of nodes between two checks of the time and node budgets
+CHECK_INTERVAL = 32
+# safety margin (in pawns) of delta pruning: a capture is skipped in the quiescence search if even winning
+# the captured piece plus this margin can not bring the score up to alpha
+DELTA_MARGIN = 2
+# number of killer moves remembered per ply
+KILLER_SLOTS = 2
+# width (in pawns) of the null windows that only ask whether a score is above a bound, one centipawn
+NULL_WINDOW = 0.01
+# null-move pruning: how much shallower than the real moves passing the turn is searched, and the least depth left
+# for it to be tried (shallower, the null-move search would cost as much as it saves)
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# late move reductions: the least depth left, the number of moves searched at full depth before any is reduced,
+# and by how many plies the later quiet moves are reduced
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3
+LMR_REDUCTION = 1
+# futility pruning: by depth left (1 or 2), how much (in pawns) a quiet move is assumed to gain at most
+FUTILITY_MARGINS = (0, 2, 4)
 
 
 def get_board_score(state):
@@ -62,32 +92,63 @@ def get_board_score(state):
     return totalScore
 
 
+def get_incremental_score(state):
+    """
+    Gets the score of the position from the evaluation terms State keeps up to date in make_move,
+    so unlike get_board_score it does not need to look at the board.
+    The score is material plus piece-square tables, blended between middlegame and endgame by the phase,
+    and is given in pawns (like get_board_score) so that it compares with CHECKMATE and STALEMATE.
+    """
+    if state.checkmate:
+        return -CHECKMATE if state.whiteToMove else CHECKMATE
+    elif state.stalemate:
+        return STALEMATE
+
+    return evaluation.tapered_score(state.middlegameScore, state.endgameScore, state.phase) / 100
+
+
 def get_random_move(validMoves):
     """Makes a random move. """
     return validMoves[random.randint(0, len(validMoves) - 1)]
 
 
-def get_best_move_min_max(state, validMoves):
-    """Helper method that will make the first recursive call. """
-    global nextMove
-    nextMove = None
+def get_best_move_min_max(state, validMoves, search=None):
+    """
+    Helper method that will make the first recursive call.
+    search (see get_move_min_max) may be passed in, e.g. to read the number of nodes visited from it afterwards.
+    """
     # shuffles possible moves so bot doesn't repeat the same move
     # when presented with multiple best moves of equal point outcome
     random.shuffle(validMoves)
-    get_move_min_max(state, validMoves, 0)
+    _, nextMove = get_move_min_max(state, validMoves, 0, search)
     return nextMove
 
 
-def get_move_min_max(state, validMoves, depth):
+def get_move_min_max(state, validMoves, depth, search=None):
     """
     Recursive function that calculates the best possible move, after simulating
     moves up to the preset level of maximum depth.
+    Returns the best score along with the move leading to it (None at the maximum depth),
+    so that no global state is needed and several searches can run at once.
+    search is the AlphaBetaSearch whose quiescence scores the leaves (made once by the first call, if not given),
+    and which counts the nodes visited; with its quiescence turned off, the leaves are scored as they are.
     """
-    global nextMove
-    # terminal condition that calculates board score if max depth is reached
-    if depth == MAX_DEPTH:
-        return get_board_score(state)
+    if search is None:
+        search = AlphaBetaSearch(0, scoreFunction=get_board_score)
 
+    # terminal condition that calculates board score if max depth is reached,
+    # after playing out the captures so that the score is not taken in the middle of an exchange
+    # (the quiescence search counts the leaf as one of its own nodes)
+    if depth == MAX_DEPTH and validMoves and search.useQuiescence:
+        turnMultiplier = 1 if state.whiteToMove else -1
+        return turnMultiplier * search.quiescence(state, -CHECKMATE - 1, CHECKMATE + 1, turnMultiplier), None
+
+    search.nodes += 1
+    # terminal condition: checkmate / stalemate (flags set when validMoves was generated), or max depth reached
+    if not validMoves or depth == MAX_DEPTH:
+        return get_board_score(state), None
+
+    nextMove = None
     # simulate move for white
     if state.whiteToMove:
         maxScore = float('-inf')
@@ -96,19 +157,15 @@ def get_move_min_max(state, validMoves, depth):
             # get new possible valid moves
             newValidMoves = state.get_valid_moves()
             # calculate the score if the move is made
-            score = get_move_min_max(
-                state, newValidMoves, depth + 1)
+            score, _ = get_move_min_max(
+                state, newValidMoves, depth + 1, search)
             if score > maxScore:
-                # update max possible score
+                # update max possible score, and the move that results in it
                 maxScore = score
-                if depth == 0:
-                    # if we are back to the original call on the recursive function,
-                    # set the nextMove equal to this new best move as it results in
-                    # the highest possible board score
-                    nextMove = move
+                nextMove = move
 
             state.undo_move()
-        return maxScore
+        return maxScore, nextMove
 
     # simulate move for black
     else:
@@ -118,16 +175,554 @@ def get_move_min_max(state, validMoves, depth):
             # get new possible valid moves
             newValidMoves = state.get_valid_moves()
             # calculate the score if the move is made
-            score = get_move_min_max(
-                state, newValidMoves, depth + 1)
+            score, _ = get_move_min_max(
+                state, newValidMoves, depth + 1, search)
             if score < minScore:
-                # update max possible score
+                # update min possible score, and the move that results in it
                 minScore = score
-                if depth == 0:
-                    # if we are back to the original call on the recursive function,
-                    # set the nextMove equal to this new best move as it results in
-                    # the highest possible board score
-                    nextMove = move
+                nextMove = move
 
             state.undo_move()
-        return minScore
+        return minScore, nextMove
+
+
+def get_best_move_alpha_beta(state, validMoves, depth=ALPHA_BETA_DEPTH, table=None):
+    """
+    Helper method that will make the first call of the alpha-beta (negamax) search.
+    Returns the best move along with the number of nodes searched, so that the pruning
+    can be compared against the full tree visited by get_best_move_min_max.
+    An optional transposition.TranspositionTable lets the search answer repeated positions from the table;
+    passing the same table on every call also reuses the results of previous searches.
+    """
+    search = AlphaBetaSearch(depth, table)
+    bestMove = search.search(state, validMoves)
+    return bestMove, search.nodes
+
+
+def get_best_move_iterative(state, validMoves, timeLimit=TIME_LIMIT, nodeLimit=None,
+                            maxDepth=MAX_ITERATION_DEPTH, table=None, stopEvent=None, onIteration=None, book=None,
+                            ordering=None, config=None):
+    """
+    Helper method that will run the iterative deepening search: depth 1, 2, 3... until the time budget
+    (in milliseconds) or the node budget runs out, maxDepth is completed, or stopEvent (a threading.Event) is set.
+    onIteration, if given, is called with the search after each completed iteration (e.g. to report progress).
+    If an opening book (book.OpeningBook) is given and has the position, its move is played without searching.
+    Pass the same MoveOrdering (like the same table) on every move of a game to keep what it learnt between moves.
+    config (a SearchConfig) selects the pruning and reductions used, all of them by default.
+    Returns the best move of the last completed iteration along with the number of nodes searched.
+    """
+    if book is not None:
+        bookMove = book.choose_move(state, validMoves)
+        if bookMove is not None:
+            return bookMove, 0
+
+    search = AlphaBetaSearch(maxDepth, table, ordering=ordering, config=config)
+    bestMove = search.iterate(state, validMoves, timeLimit, nodeLimit, stopEvent, onIteration)
+    return bestMove, search.nodes
+
+
+def get_best_move_parallel(state, validMoves, depth=ALPHA_BETA_DEPTH, workers=None, executor=None):
+    """
+    Helper method that will run a root-parallel alpha-beta search: the root moves are split across
+    a pool of worker processes, each searching its moves on its own copy of the position (rebuilt from FEN,
+    along with the keys of the positions since the last capture or pawn move, so that repetitions are seen).
+    The first (best ordered) root move is searched alone, so that its score can be handed to the other workers
+    as alpha: any root move that can not beat it is then cut off just as in the single process search.
+    After that one move per worker is in flight at a time, each started with the best score found so far.
+    Pass an existing concurrent.futures.ProcessPoolExecutor (and its number of workers) to avoid starting
+    new processes on every call.
+    Returns the best move along with the total number of nodes searched by all the workers.
+    """
+    if not validMoves:
+        return None, 0
+    # imported here rather than at the top, as it pulls in multiprocessing, which most callers never need
+    # (this keeps the startup of e.g. cli.py short)
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    # shuffles possible moves so bot doesn't repeat the same move
+    # when presented with multiple best moves of equal point outcome
+    random.shuffle(validMoves)
+    rootMoves = order_moves(validMoves)
+    fen = state.to_fen()
+    # a FEN only describes the current position, so the earlier ones a repetition could go back to are sent along
+    keyHistory = state.zobristKeyLog[-1 - state.halfmoveClock:-1] if state.halfmoveClock else []
+
+    workers = workers or os.cpu_count()
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # search the first move alone, then the rest in parallel with the best score so far as the bound to beat
+        bestID, bestScore, nodes = executor.submit(
+            search_root_move, fen, state.backend, rootMoves[0].moveID, depth, -CHECKMATE - 1, keyHistory).result()
+        waiting = [move.moveID for move in rootMoves[1:]]
+        running = set()
+        while waiting or running:
+            while waiting and len(running) < workers:
+                running.add(executor.submit(
+                    search_root_move, fen, state.backend, waiting.pop(0), depth, bestScore, keyHistory))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                moveID, score, moveNodes = future.result()
+                nodes += moveNodes
+                if score > bestScore:
+                    bestID, bestScore = moveID, score
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+
+    for move in validMoves:
+        if move.moveID == bestID:
+            return move, nodes
+
+
+def search_root_move(fen, backend, moveID, depth, alpha, keyHistory=()):
+    """
+    Searches one root move in a worker process, returning (moveID, score, nodes) with the score
+    from the point of view of the side to move at the root.
+    A score that can not beat alpha is only an upper bound, which is all the caller needs to discard the move.
+    keyHistory holds the Zobrist keys of the positions before the root (oldest first), for detecting repetitions.
+    """
+    state = engine.State.from_fen(fen, backend)
+    state.zobristKeyLog[:0] = keyHistory  # the repetition count only reads the key log (see get_repetition_count)
+    turnMultiplier = 1 if state.whiteToMove else -1
+    move = next(move for move in state.get_valid_moves() if move.moveID == moveID)
+
+    search = AlphaBetaSearch(depth)
+    state.make_move(move)
+    score = -search.negamax(state, depth - 1, -CHECKMATE - 1, -alpha, -turnMultiplier, ply=1)
+    return moveID, score, search.nodes
+
+
+def get_score_for_table(score, ply):
+    """
+    Converts a score for the transposition table: a checkmate is stored by its distance from the position
+    rather than from the root, since the same position can be reached at any ply.
+    """
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def get_score_from_table(score, ply):
+    """Converts a score from the transposition table back to one from the root (see get_score_for_table). """
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def get_move_order_score(move):
+    """
+    Scores a move for ordering: captures first, most valuable victim / least valuable attacker (MVV-LVA).
+    Quiet moves all score the same, so they keep their (shuffled) order behind the captures.
+    """
+    if move.pieceCaptured:
+        return 10 * PIECE_POINTS[move.pieceCaptured[1]] - PIECE_POINTS[move.pieceMoved[1]] + 10
+    return 0
+
+
+def order_moves(validMoves, firstMove=None, orderKey=get_move_order_score):
+    """
+    Returns the moves sorted so that the ones most likely to cause a cutoff are searched first.
+    firstMove (e.g. the best move found by an earlier search of the position) is always searched first.
+    """
+    orderedMoves = sorted(validMoves, key=orderKey, reverse=True)
+    if firstMove is not None:
+        for i, move in enumerate(orderedMoves):
+            if move == firstMove:
+                orderedMoves.insert(0, orderedMoves.pop(i))
+                break
+    return orderedMoves
+
+
+class MoveOrdering():
+    """
+    What the search learns about quiet moves (neither captures nor promotions, which MVV-LVA can not order):
+    1) killer moves: per ply, the last KILLER_SLOTS quiet moves that caused a cutoff. A move refuting one line
+    often refutes its siblings too, so the staged move generation tries them before the other quiet moves.
+    2) the history table: per side and from/to squares, how many cutoffs a quiet move caused, weighted by the
+    depth left (deep cutoffs save the most). The remaining quiet moves are searched in this order.
+    Both are kept over the iterations of a search; between moves (see age) the killers are dropped, as their plies
+    no longer match, and the history is halved, so it follows the game without forgetting everything.
+    """
+
+    def __init__(self):
+        self.killers = {}  # ply -> killer moves, most recent first
+        # indexed by the low 12 bits of Move.moveID (from and to squares), plus 4096 for black's moves
+        self.history = [0] * (2 * 4096)
+
+    def get_killers(self, ply):
+        """Returns the killer moves of the ply, most recent first. """
+        return self.killers.get(ply, ())
+
+    def add_cutoff(self, move, ply, depth):
+        """Records that a quiet move caused a cutoff at the ply, with `depth` plies left to search. """
+        killers = self.killers.get(ply, [])
+        if move not in killers:
+            self.killers[ply] = [move] + killers[:KILLER_SLOTS - 1]
+        self.history[self.get_history_index(move)] += depth * depth
+
+    def get_history_index(self, move):
+        """Returns the index of a move in the history table. """
+        return (move.moveID & 0xFFF) + (4096 if move.pieceMoved[0] == "b" else 0)
+
+    def get_order_score(self, move):
+        """Scores a move for ordering: captures by MVV-LVA (see get_move_order_score), quiet moves by history. """
+        if move.pieceCaptured:
+            return get_move_order_score(move)
+        # get_history_index, inlined since this scores every move the search sorts
+        return self.history[(move.moveID & 0xFFF) + (4096 if move.pieceMoved[0] == "b" else 0)]
+
+    def age(self):
+        """Forgets the killers and halves the history, e.g. before searching the next move of the game. """
+        self.killers = {}
+        self.history = [score // 2 for score in self.history]
+
+
+class SearchConfig():
+    """
+    Switches for the selective parts of the search. Unlike alpha-beta cutoffs, these skip or shorten moves that are
+    only likely (not certain) not to matter, so each can be turned off to measure what it gains and costs:
+    1) nullMove: null-move pruning. If the side to move could pass and still score at least beta in a shallower
+    search, a real move will almost surely do so too, and the position is cut off without searching its moves.
+    Not tried in check, nor with only king and pawns left, where zugzwang (any move being worse than passing) is common.
+    2) lateMoveReductions: quiet moves ordered late (after the hash move, captures, killers and the best history) rarely
+    turn out best, so they are searched one ply shallower, and only searched again at full depth if they raise alpha.
+    3) futility: one or two plies from the horizon, quiet moves are skipped when even the static score plus
+    FUTILITY_MARGINS can not reach alpha.
+    Moves that give check are never reduced or pruned, and nothing is when in check.
+    """
+
+    def __init__(self, nullMove=True, lateMoveReductions=True, futility=True):
+        self.nullMove = nullMove
+        self.lateMoveReductions = lateMoveReductions
+        self.futility = futility
+
+
+class SearchAborted(Exception):
+    """Raised inside the search once its time or node budget is spent, to unwind the recursion. """
+
+
+class AlphaBetaSearch():
+    """
+    Holds everything a single alpha-beta search needs, so the search does not rely on module globals.
+
+    Negamax is the same min-max search written once for both players: a position's score for the side to move
+    is the negative of its score for the opponent. Alpha is the score the side to move is already guaranteed,
+    beta the score the opponent is already guaranteed; once a move scores at least beta the opponent
+    will never allow this position, so the remaining moves do not need to be searched (a cutoff).
+    """
+
+    def __init__(self, maxDepth, table=None, scoreFunction=get_incremental_score, quiescence=True, ordering=None,
+                 config=None):
+        self.maxDepth = maxDepth
+        self.table = table  # optional transposition table, shared between searches by the caller
+        # killer moves and history of the quiet moves (see MoveOrdering), shared between searches by the caller,
+        # or False to leave quiet moves in generation order
+        self.ordering = MoveOrdering() if ordering is None else ordering
+        # function scoring a position at the search horizon (positive favours white), e.g. get_board_score
+        self.scoreFunction = scoreFunction
+        # whether captures are played out at the search horizon (see quiescence)
+        self.useQuiescence = quiescence
+        # which selective pruning and reductions are used (all of them by default, see SearchConfig)
+        self.config = SearchConfig() if config is None else config
+        self.nullMoveLogLengths = []  # length of state.log at each null move on the board, to take them back on abort
+        self.nodes = 0  # number of positions visited
+        self.bestMove = None
+        # move ordering quality: the better the ordering, the more cutoffs happen on the first move searched
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+
+        # budgets of the iterative deepening search (None means unlimited)
+        self.deadline = None  # time.perf_counter() value at which to stop
+        self.nodeLimit = None
+        self.stopEvent = None  # lets another thread stop the search
+        self.nextCheck = CHECK_INTERVAL  # node count at which the budgets are checked next
+
+        # principal variation: the line both sides are expected to play
+        self.pvLines = {}  # best line found so far from each ply of the current iteration
+        self.pv = []  # principal variation of the last completed iteration
+        self.score = 0  # score of the last completed iteration, for the side to move
+        self.completedDepth = 0
+
+    def iterate(self, state, validMoves, timeLimit=None, nodeLimit=None, stopEvent=None, onIteration=None):
+        """
+        Searches the position at depth 1, 2, 3... up to self.maxDepth, until a budget runs out or stopEvent is set.
+        Each iteration searches the previous iteration's principal variation first, which makes the cutoffs
+        of the deeper search happen early; an iteration that runs out of budget is thrown away.
+        onIteration, if given, is called with the search after each completed iteration, once completedDepth,
+        score, pv and nodes describe it.
+        """
+        self.nodes = 0
+        self.cutoffs = self.firstMoveCutoffs = 0
+        self.bestMove = None
+        self.pv = []
+        self.score = 0
+        self.completedDepth = 0
+        if self.ordering:
+            self.ordering.age()  # the killers and history are kept over the iterations, but age between moves
+        self.deadline = time.perf_counter() + timeLimit / 1000 if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.stopEvent = stopEvent
+        self.nextCheck = CHECK_INTERVAL
+        if not validMoves:
+            return None
+
+        # shuffles possible moves so bot doesn't repeat the same move
+        # when presented with multiple best moves of equal point outcome
+        random.shuffle(validMoves)
+        turnMultiplier = 1 if state.whiteToMove else -1
+        rootLogLength = len(state.log)
+        finalDepth = self.maxDepth
+        bestMove = None
+
+        for depth in range(1, finalDepth + 1):
+            self.maxDepth = depth
+            self.pvLines = {}
+            try:
+                score = self.negamax(state, depth, -CHECKMATE - 1, CHECKMATE + 1, turnMultiplier, validMoves)
+            except SearchAborted:
+                # take back the moves (and null moves) the unfinished iteration left on the board
+                while len(state.log) > rootLogLength or self.nullMoveLogLengths:
+                    if self.nullMoveLogLengths and self.nullMoveLogLengths[-1] == len(state.log):
+                        self.nullMoveLogLengths.pop()
+                        state.undo_null_move()
+                    else:
+                        state.undo_move()
+                break
+            bestMove = self.bestMove
+            self.pv = self.pvLines.get(0, [])
+            self.score = score
+            self.completedDepth = depth
+            if onIteration is not None:
+                onIteration(self)
+            if abs(score) >= MATE_BOUND:
+                break  # a forced checkmate was found, searching deeper will not change the move
+
+        self.maxDepth = finalDepth
+        # if not even depth 1 could be completed, any valid move is better than none
+        self.bestMove = bestMove if bestMove is not None else validMoves[0]
+        return self.bestMove
+
+    def check_budget(self):
+        """Raises SearchAborted once the time or node budget is spent, or the search was asked to stop. """
+        self.nextCheck = self.nodes + CHECK_INTERVAL
+        if self.stopEvent is not None and self.stopEvent.is_set():
+            raise SearchAborted()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            raise SearchAborted()
+
+    def search(self, state, validMoves):
+        """Searches the position to self.maxDepth and returns the best move found. """
+        self.nodes = 0
+        self.cutoffs = self.firstMoveCutoffs = 0
+        self.bestMove = None
+        # shuffles possible moves so bot doesn't repeat the same move
+        # when presented with multiple best moves of equal point outcome
+        random.shuffle(validMoves)
+        turnMultiplier = 1 if state.whiteToMove else -1
+        self.negamax(state, self.maxDepth, -CHECKMATE - 1, CHECKMATE + 1, turnMultiplier, validMoves)
+        return self.bestMove
+
+    def negamax(self, state, depth, alpha, beta, turnMultiplier, validMoves=None, ply=0, allowNullMove=True):
+        """
+        Recursive function that returns the score of the position for the side to move,
+        skipping every move that can not change the result.
+        Valid moves are only generated once the transposition table could not answer the position,
+        and then in stages (see State.get_staged_moves), so that a cutoff skips generating the rest.
+        ply is the distance from the root (reductions make it differ from self.maxDepth - depth), and
+        allowNullMove is False right after a null move, so that two are never made in a row.
+        """
+        self.nodes += 1
+        if self.nodes >= self.nextCheck:
+            self.check_budget()
+        isRoot = ply == 0
+        originalAlpha = alpha
+        self.pvLines[ply] = []
+
+        # a position already reached since the last capture or pawn move is scored as a draw straight away,
+        # rather than searching the same cycle of moves again (the fifty-move rule ends the game the same way)
+        if not isRoot and state.halfmoveClock >= 4:
+            if state.halfmoveClock >= 100 or state.get_repetition_count(2) >= 2:
+                return DRAW
+
+        tableMove = None
+        if self.table is not None:
+            entry = self.table.probe(state.zobristKey)
+            if entry is not None:
+                _, entryDepth, entryScore, bound, tableMoveID = entry
+                entryScore = get_score_from_table(entryScore, ply)
+                # the stored score can only be trusted if it was searched at least as deep,
+                # and the root always searches so that it has a move to return
+                if entryDepth >= depth and not isRoot:
+                    if bound == transposition.EXACT:
+                        return entryScore
+                    elif bound == transposition.LOWER_BOUND and entryScore >= beta:
+                        return entryScore
+                    elif bound == transposition.UPPER_BOUND and entryScore <= alpha:
+                        return entryScore
+                if tableMoveID:
+                    tableMove = state.get_move(tableMoveID)
+
+        # terminal condition: max depth reached
+        if depth == 0:
+            if self.useQuiescence:
+                return self.quiescence(state, alpha, beta, turnMultiplier, ply)
+            state.get_valid_moves()  # sets the checkmate / stalemate flags the score depends on
+            return self.get_leaf_score(state, turnMultiplier, ply)
+
+        config = self.config
+        inCheck = state.is_in_check()
+        # the static score (without the checkmate / stalemate flags, which are not set before the moves are generated)
+        # decides whether the selective pruning is worth trying
+        staticScore = None
+        if not inCheck and not isRoot:
+            staticScore = turnMultiplier * evaluation.tapered_score(
+                state.middlegameScore, state.endgameScore, state.phase) / 100
+
+        # null-move pruning: pass the turn, and if a shallower search still scores at least beta, cut off
+        if config.nullMove and allowNullMove and staticScore is not None and depth >= NULL_MOVE_MIN_DEPTH and \
+                staticScore >= beta and abs(beta) < MATE_BOUND and state.has_non_pawn_material():
+            self.nullMoveLogLengths.append(len(state.log))
+            state.make_null_move()
+            score = -self.negamax(state, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW,
+                                  -turnMultiplier, ply=ply + 1, allowNullMove=False)
+            state.undo_null_move()
+            self.nullMoveLogLengths.pop()
+            if score >= beta:
+                # a checkmate found after passing is not a real one, so only the bound is returned
+                return beta
+
+        # futility pruning: this close to the horizon, quiet moves can not bring a score this low up to alpha
+        futilityScore = None
+        if config.futility and staticScore is not None and depth < len(FUTILITY_MARGINS) and \
+                abs(alpha) < MATE_BOUND and staticScore + FUTILITY_MARGINS[depth] <= alpha:
+            futilityScore = staticScore + FUTILITY_MARGINS[depth]
+
+        # the previous iteration's principal variation is the best guess when the table has none
+        if tableMove is None and ply < len(self.pv):
+            tableMove = self.pv[ply]
+
+        ordering = self.ordering
+        orderKey = ordering.get_order_score if ordering else get_move_order_score
+        killers = ordering.get_killers(ply) if ordering else ()
+        if validMoves is None:
+            moves = state.get_staged_moves(tableMove, killers, orderKey)
+        else:
+            moves = order_moves(validMoves, tableMove, orderKey)
+        # late move reductions are tried from the first quiet move ordered after the full depth ones
+        reduceLateMoves = config.lateMoveReductions and not inCheck and not isRoot and depth >= LMR_MIN_DEPTH
+
+        maxScore = -CHECKMATE - 1
+        bestMove = None
+        movesSearched = 0
+        for move in moves:
+            isQuiet = not move.pieceCaptured and not move.isPawnPromotion
+            state.make_move(move)  # simulate move
+            # a quiet move is only pruned or reduced if it does not give check, and the first move never is
+            selective = isQuiet and movesSearched and \
+                (futilityScore is not None or reduceLateMoves and movesSearched >= LMR_FULL_DEPTH_MOVES and
+                 move != tableMove and move not in killers) and not state.is_in_check()
+            if selective and futilityScore is not None:
+                state.undo_move()
+                maxScore = max(maxScore, futilityScore)  # still an upper bound of what the move could score
+                continue
+
+            movesSearched += 1
+            if selective:
+                # a late quiet move only needs to prove it can raise alpha, at a reduced depth ...
+                score = -self.negamax(state, depth - 1 - LMR_REDUCTION, -alpha - NULL_WINDOW, -alpha,
+                                      -turnMultiplier, ply=ply + 1)
+                # ... and is searched again at full depth if it does
+                if score > alpha:
+                    score = -self.negamax(state, depth - 1, -beta, -alpha, -turnMultiplier, ply=ply + 1)
+            else:
+                score = -self.negamax(state, depth - 1, -beta, -alpha, -turnMultiplier, ply=ply + 1)
+            state.undo_move()
+
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                if isRoot:
+                    self.bestMove = move
+            if maxScore > alpha:
+                alpha = maxScore
+                # a new best line from this ply: this move followed by the best line found below it
+                self.pvLines[ply] = [move] + self.pvLines.get(ply + 1, [])
+            if alpha >= beta:
+                self.cutoffs += 1
+                if movesSearched == 1:
+                    self.firstMoveCutoffs += 1
+                if ordering and isQuiet:
+                    ordering.add_cutoff(move, ply, depth)
+                break  # cutoff: the opponent will avoid this position
+
+        # terminal condition: checkmate / stalemate (flags set once the moves ran out)
+        if bestMove is None:
+            return self.get_leaf_score(state, turnMultiplier, ply)
+
+        if self.table is not None:
+            if maxScore <= originalAlpha:
+                bound = transposition.UPPER_BOUND
+            elif maxScore >= beta:
+                bound = transposition.LOWER_BOUND
+            else:
+                bound = transposition.EXACT
+            self.table.store(state.zobristKey, depth, get_score_for_table(maxScore, ply), bound, bestMove)
+        return maxScore
+
+    def get_leaf_score(self, state, turnMultiplier, ply):
+        """Scores a position for the side to move with scoreFunction, and a checkmate by its ply (see MATE_BOUND). """
+        if state.checkmate:
+            return -CHECKMATE + ply  # the side to move is the one checkmated
+        return turnMultiplier * self.scoreFunction(state)
+
+    def quiescence(self, state, alpha, beta, turnMultiplier, ply=0):
+        """
+        Searches captures and promotions only, until the position is quiet, and returns its score for the side
+        to move. Scoring the search horizon in the middle of an exchange (e.g. right after a queen took a defended
+        pawn) is what makes a fixed depth search blunder, and playing out the captures is far cheaper than
+        searching every move one ply deeper.
+        Unless in check, the side to move may also "stand pat": keep the static score instead of capturing.
+        ply is the distance from the root, which a checkmate is scored by.
+        """
+        self.nodes += 1
+        if self.nodes >= self.nextCheck:
+            self.check_budget()
+
+        moves = state.get_valid_captures()
+        # in check every move was generated, and there is no standing pat
+        if state.inCheck:
+            if not moves:
+                return self.get_leaf_score(state, turnMultiplier, ply)  # checkmate (flag set by get_valid_captures)
+            standPat = None
+            maxScore = -CHECKMATE - 1
+        else:
+            standPat = turnMultiplier * self.scoreFunction(state)
+            if standPat >= beta:
+                return standPat  # cutoff: already good enough without capturing anything
+            alpha = max(alpha, standPat)
+            maxScore = standPat
+
+        for move in order_moves(moves):
+            # delta pruning: skip captures that can not raise alpha even if the captured piece comes for free
+            if standPat is not None and not move.isPawnPromotion and \
+                    standPat + PIECE_POINTS[move.pieceCaptured[1]] + DELTA_MARGIN <= alpha:
+                continue
+            state.make_move(move)
+            score = -self.quiescence(state, -beta, -alpha, -turnMultiplier, ply + 1)
+            state.undo_move()
+
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break  # cutoff: the opponent will avoid this position
+        return maxScore
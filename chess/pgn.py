@@ -0,0 +1,246 @@
+# Reading games in PGN (Portable Game Notation) and replaying them on State, e.g. to gather statistics or
+# training data from large game archives.
+# - read_games streams the games of a file one at a time, so an archive of any size is never held in memory
+# (files ending in .gz or .bz2 are decompressed on the fly)
+# - resolve_san finds the valid move a move in standard algebraic notation (SAN, e.g. "Nbd7" or "exd8=Q+") stands for
+# - replay_game yields the position before every move of a game
+# - replay_files replays whole files, in parallel across worker processes
+#
+# Run from this directory with: python pgn.py games.pgn [more.pgn ...] [--workers N]
+import argparse
+import bz2
+import gzip
+import os
+import re
+
+from chess_notation import ChessNotation
+import engine
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+NOTATION = ChessNotation()
+# piece letter (none for a pawn), file and/or rank of the moving piece, capture, target square, promotion
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# a {comment} (to the end of the line if it goes on to the next ones), a ; comment (to the end of the line),
+# the bracket of a variation, or anything else up to the next space (a move, a move number, a NAG or the result)
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}?|;.*|[()]|[^\s{}();]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+
+def open_pgn(path):
+    """Opens a PGN file for reading as text, decompressing it if its name ends in .gz or .bz2. """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def read_games(lines):
+    """
+    Yields the games of a PGN file (or any iterable of its lines) one at a time, as a tuple of
+    (headers, moves): a dictionary of the tag pairs, and the list of moves in SAN.
+    Comments, variations, move numbers, annotations (e.g. "!?" or "$1") and the result are left out.
+    Only the lines of the game being read are kept in memory.
+    """
+    headers = {}
+    moves = []
+    inComment = False  # inside a {comment} that goes on over several lines
+    variationDepth = 0  # inside a (variation), which may be nested
+
+    for line in lines:
+        if inComment:
+            end = line.find("}")
+            if end < 0:
+                continue
+            inComment = False
+            line = line[end + 1:]
+        elif not variationDepth:
+            line = line.strip()
+            if line.startswith("["):
+                # a tag pair after some moves starts the next game
+                if moves:
+                    yield headers, moves
+                    headers, moves = {}, []
+                tag = TAG_PATTERN.match(line)
+                if tag:
+                    headers[tag.group(1)] = tag.group(2)
+                continue
+            if line.startswith("%"):
+                continue  # escaped line
+
+        for token in TOKEN_PATTERN.findall(line):
+            if token[0] == "{":
+                inComment = not token.endswith("}")
+            elif token[0] == ";":
+                break
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth or token[0] == "$":
+                continue
+            elif token in RESULTS:
+                yield headers, moves
+                headers, moves = {}, []
+            else:
+                # leave out move numbers ("12." or "12...", which may be glued to the move) and annotations ("!?")
+                token = MOVE_NUMBER_PATTERN.sub("", token).rstrip("!?")
+                if token:
+                    moves.append(token)
+
+    # a game without a result at the end of the file
+    if moves:
+        yield headers, moves
+
+
+def resolve_san(state, san):
+    """
+    Returns the valid move a move in SAN stands for in the position.
+    Rather than generating every valid move, only the pieces the SAN names are tried, with State.is_valid_move.
+    Raises ValueError if the move is not valid in the position, or is ambiguous.
+    """
+    board = state.get_board_rows()
+    allyColor = "w" if state.whiteToMove else "b"
+    san = san.rstrip("+#")
+
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingRow, kingCol = state.whiteKingPosition if state.whiteToMove else state.blackKingPosition
+        endCol = kingCol + 2 if len(san) == 3 else kingCol - 2
+        if -1 < endCol < 8:
+            move = engine.Move((kingRow, kingCol), (kingRow, endCol), board, isCastleMove=True)
+            if state.is_valid_move(move):
+                return move
+        raise ValueError("castling {} is not valid in position {}".format(san, state.to_fen()))
+
+    parsed = SAN_PATTERN.match(san)
+    if not parsed:
+        raise ValueError("can not read the move {}".format(san))
+    pieceType, fromFile, fromRank, target, promotion = parsed.groups()
+    piece = allyColor + (pieceType or "P")
+    endSq = NOTATION.get_square(target)
+    fromCol = NOTATION.fileToCol[fromFile] if fromFile else None
+    fromRow = NOTATION.rankToRow[fromRank] if fromRank else None
+    # a pawn moving to another file onto an empty square can only be capturing en passant
+    isEnPassant = piece[1] == "P" and fromCol is not None and fromCol != endSq[1] and not board[endSq[0]][endSq[1]]
+
+    matches = []
+    for i in range(8) if fromRow is None else (fromRow,):
+        row = board[i]
+        for j in range(8) if fromCol is None else (fromCol,):
+            if row[j] == piece:
+                move = engine.Move((i, j), endSq, board, isEnPassantMove=isEnPassant, promotionChoice=promotion or "Q")
+                if state.is_valid_move(move):
+                    matches.append(move)
+    if len(matches) != 1:
+        raise ValueError("the move {} is {} in position {}".format(
+            san, "ambiguous" if matches else "not valid", state.to_fen()))
+    return matches[0]
+
+
+def get_san(state, move, validMoves=None):
+    """Returns the SAN of a valid move of the position (the inverse of resolve_san), with + or # for a check. """
+    if validMoves is None:
+        validMoves = state.get_valid_moves()
+
+    if move.isCastleMove:
+        san = "O-O" if move.endCol > move.startCol else "O-O-O"
+    else:
+        pieceType = move.pieceMoved[1]
+        target = NOTATION.get_square_name(move.endRow, move.endCol)
+        if pieceType == "P":
+            san = NOTATION.colToFile[move.startCol] + "x" + target if move.pieceCaptured else target
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            # name the file, the rank or the square of the moving piece if another piece of its kind could move there
+            others = [other for other in validMoves if other.pieceMoved == move.pieceMoved and
+                      other.endRow == move.endRow and other.endCol == move.endCol and other != move]
+            origin = ""
+            if others:
+                if all(other.startCol != move.startCol for other in others):
+                    origin = NOTATION.colToFile[move.startCol]
+                elif all(other.startRow != move.startRow for other in others):
+                    origin = NOTATION.rowToRank[move.startRow]
+                else:
+                    origin = NOTATION.get_square_name(move.startRow, move.startCol)
+            san = pieceType + origin + ("x" if move.pieceCaptured else "") + target
+
+    state.make_move(move)
+    if state.is_in_check():
+        san += "#" if not state.get_valid_moves() else "+"
+    state.undo_move()
+    return san
+
+
+def replay_game(headers, moves):
+    """
+    Yields (state, move) for every move of a game, the state being the position before the move.
+    The same State is yielded every time and changes as the game goes on, so anything needed from it
+    has to be taken (e.g. state.to_fen()) before asking for the next move.
+    Raises ValueError at the first move that can not be played.
+    """
+    if headers.get("FEN"):
+        state = engine.State.from_fen(headers["FEN"])
+    else:
+        state = engine.State()
+    for san in moves:
+        move = resolve_san(state, san)
+        yield state, move
+        state.make_move(move)
+
+
+def replay_file(path, visit=None):
+    """
+    Replays every game of a PGN file, calling visit(headers, state, move) (if given) before every move.
+    Games with a move that can not be played are counted as errors and skipped from that move on.
+    Returns the counts as a dictionary of games, plies and errors.
+    """
+    counts = {"games": 0, "plies": 0, "errors": 0}
+    with open_pgn(path) as pgnFile:
+        for headers, moves in read_games(pgnFile):
+            counts["games"] += 1
+            try:
+                for state, move in replay_game(headers, moves):
+                    if visit is not None:
+                        visit(headers, state, move)
+                    counts["plies"] += 1
+            except ValueError:
+                counts["errors"] += 1
+    return counts
+
+
+def replay_files(paths, workers=None, visit=None):
+    """
+    Replays the PGN files one per worker process (see replay_file), and returns the counts added up.
+    visit has to be a module-level function, so that it can be sent to the workers.
+    With a single worker (or a single file) the files are replayed in this process instead.
+    """
+    total = {"games": 0, "plies": 0, "errors": 0}
+    workers = min(workers or os.cpu_count(), len(paths))
+    if workers <= 1:
+        results = [replay_file(path, visit) for path in paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(replay_file, paths, [visit] * len(paths)))
+    for counts in results:
+        for name in total:
+            total[name] += counts[name]
+    return total
+
+
+def main():
+    """Replays PGN files and prints how many games and positions they hold. """
+    parser = argparse.ArgumentParser(description="Replay the games of PGN files.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, help="number of worker processes (one per CPU by default)")
+    args = parser.parse_args()
+
+    counts = replay_files(args.paths, args.workers)
+    print("{games} games, {plies} positions, {errors} games with an invalid move".format(**counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# the transposition table lets the search reuse the result of any position it has already searched,
+# e.g. the same position reached through Nf3 then Nc3 or through Nc3 then Nf3
+from array import array
+
+# bound types: what the stored score tells us about the real score of the position
+EXACT = 0  # the score is exact
+LOWER_BOUND = 1  # the search was cut off (beta cutoff), so the real score is at least this
+UPPER_BOUND = 2  # no move raised alpha, so the real score is at most this
+
+# memory cost of one slot: the table is three parallel arrays of 8-byte items (key, score, and the rest packed
+# into one int), allocated in full up front, so sizeMB is a hard bound rather than an estimate
+ENTRY_BYTES = 3 * 8
+
+# layout of the packed int of a slot: bit 0 is set in every used slot, then 2 bits of bound, 8 bits of depth,
+# and the best move's Move.moveID (0 when there is none) in the remaining bits
+BOUND_SHIFT = 1
+DEPTH_SHIFT = 3
+MOVE_SHIFT = 11
+
+
+class TranspositionTable():
+    """
+    Fixed-size hash table of search results, keyed by State.zobristKey.
+
+    The table is split into buckets of 2 slots, and the bucket of a position is picked by its key:
+    1) the depth-preferred slot keeps whichever entry was searched deepest, since it saved the most work
+    2) the always-replace slot takes every entry the depth-preferred slot refused, so recent positions are kept too
+    An entry is probed as a tuple of (key, depth, score, bound, moveID): the best move is stored as its id only
+    (a Move object would cost several times the slot), and State.get_move turns it back into a Move.
+    """
+
+    def __init__(self, sizeMB=16):
+        self.buckets = max(1, sizeMB * 1024 * 1024 // (2 * ENTRY_BYTES))
+        self.allocate()
+
+        # counters for tuning the table size
+        self.hits = 0  # lookups that found the position
+        self.misses = 0  # lookups that did not find the position
+        self.collisions = 0  # misses where the bucket was taken by other positions
+        self.stores = 0
+        self.overwrites = 0  # stores that replaced another position's entry
+
+    def allocate(self):
+        """Allocates the (empty) slots. """
+        slots = 2 * self.buckets
+        self.keys = array("Q", [0]) * slots
+        self.scores = array("d", [0.0]) * slots
+        self.data = array("q", [0]) * slots  # 0 marks an empty slot
+
+    def probe(self, key):
+        """Returns the entry stored for the key as (key, depth, score, bound, moveID), or None if it is not stored. """
+        index = 2 * (key % self.buckets)
+        keys, data = self.keys, self.data
+        for slot in (index, index + 1):
+            if data[slot] and keys[slot] == key:
+                self.hits += 1
+                packed = data[slot]
+                return (key, packed >> DEPTH_SHIFT & 0xFF, self.scores[slot], packed >> BOUND_SHIFT & 3,
+                        packed >> MOVE_SHIFT)
+
+        self.misses += 1
+        if data[index] or data[index + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, bestMove):
+        """Stores a search result, following the bucket's replacement scheme. """
+        index = 2 * (key % self.buckets)
+        keys, data = self.keys, self.data
+        self.stores += 1
+
+        # the depth-preferred slot, unless it holds a deeper search of another position
+        slot = index
+        if data[index] and keys[index] != key and depth < data[index] >> DEPTH_SHIFT & 0xFF:
+            slot = index + 1
+        if data[slot] and keys[slot] != key:
+            self.overwrites += 1
+        keys[slot] = key
+        self.scores[slot] = score
+        data[slot] = 1 | bound << BOUND_SHIFT | min(depth, 0xFF) << DEPTH_SHIFT | \
+            (bestMove.moveID if bestMove is not None else 0) << MOVE_SHIFT
+
+    def clear(self):
+        """Empties the table and resets the counters. """
+        self.allocate()
+        self.hits = self.misses = self.collisions = self.stores = self.overwrites = 0
+
+    def usage(self):
+        """Returns the fraction of slots in use. """
+        return sum(1 for packed in self.data if packed) / len(self.data)
+
+    def stats(self):
+        """Returns the counters as a dictionary (e.g. for printing while tuning). """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
@@ -0,0 +1,203 @@
+# UCI (Universal Chess Interface) front end, so the engine can be run by tournament managers and match harnesses.
+# Run from this directory with: python uci.py
+# The GUI sends commands on stdin and reads the engine's answers on stdout. The commands supported are
+# uci, isready, ucinewgame, setoption (Hash), position, go, stop and quit.
+# The search runs on a thread of its own, so that stop (or quit) is read while it is thinking;
+# it ends the search within CHECK_INTERVAL nodes, through the stop event the search polls.
+import sys
+import threading
+import time
+
+from cli import START_FEN, load_position
+import move_finder
+import transposition
+
+ENGINE_NAME = "chess"
+ENGINE_AUTHOR = "babybear4812"
+DEFAULT_HASH_MB = 16  # size of the transposition table, which is kept between moves of a game
+MAX_HASH_MB = 1024
+MOVES_TO_GO = 30  # number of moves the remaining clock time is shared by, when the GUI does not say
+MOVE_OVERHEAD = 50  # milliseconds kept back from every move for the time it takes to send it
+
+
+class UCIEngine():
+    """
+    Holds the position, the transposition table and the search thread between commands.
+    Every line the engine writes goes through `output` (print by default), which may be called from the search thread.
+    """
+
+    def __init__(self, output=None):
+        self.output = output or (lambda line: print(line, flush=True))
+        self.outputLock = threading.Lock()  # keeps lines of the search thread and the command loop apart
+        self.state = load_position(START_FEN)
+        self.hashMB = DEFAULT_HASH_MB
+        self.table = transposition.TranspositionTable(self.hashMB)
+        self.ordering = move_finder.MoveOrdering()  # killer moves and history, kept between moves like the table
+
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+
+    def send(self, line):
+        """Writes one line to the GUI. """
+        with self.outputLock:
+            self.output(line)
+
+    def handle(self, line):
+        """
+        Carries out one command; returns False once the engine should exit (quit).
+        A command that can not be read (e.g. "go depth x") is reported to the GUI and otherwise ignored,
+        so that one bad line does not end the engine.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        try:
+            return self.run_command(command, arguments)
+        except (ValueError, IndexError) as error:
+            self.send("info string could not read {}: {}".format(line.strip(), error))
+            return True
+
+    def run_command(self, command, arguments):
+        """Carries out one command (see handle). """
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default {} min 1 max {}".format(DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.table.clear()
+            self.ordering = move_finder.MoveOrdering()
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "position":
+            self.stop()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def set_option(self, arguments):
+        """Handles "setoption name <name> value <value>"; Hash (in MB) is the only option. """
+        if "name" not in arguments or "value" not in arguments:
+            return
+        name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")])
+        value = " ".join(arguments[arguments.index("value") + 1:])
+        if name.lower() == "hash" and value.isdigit():
+            self.stop()
+            self.hashMB = min(max(int(value), 1), MAX_HASH_MB)
+            self.table = transposition.TranspositionTable(self.hashMB)
+
+    def set_position(self, arguments):
+        """Handles "position startpos [moves ...]" and "position fen <fen> [moves ...]". """
+        moves = arguments[arguments.index("moves") + 1:] if "moves" in arguments else []
+        if arguments and arguments[0] == "fen":
+            end = arguments.index("moves") if "moves" in arguments else len(arguments)
+            fen = " ".join(arguments[1:end])
+        else:
+            fen = START_FEN
+        try:
+            self.state = load_position(fen, moves)
+        except ValueError as error:
+            # keep the previous position rather than searching a different one than the GUI asked for
+            self.send("info string " + str(error))
+
+    def go(self, arguments):
+        """
+        Handles "go" with any of depth, nodes, movetime, wtime, btime, winc, binc, movestogo and infinite,
+        starting the search thread. Without any limit the search runs until stop.
+        """
+        limits = {}
+        for name in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+            if name in arguments:
+                index = arguments.index(name) + 1
+                if index == len(arguments):
+                    raise ValueError("{} has no value".format(name))
+                limits[name] = int(arguments[index])
+
+        maxDepth = limits.get("depth", move_finder.MAX_ITERATION_DEPTH)
+        timeLimit = self.get_time_limit(limits)
+        # with "go infinite" (or no limit at all) the best move must not be sent before stop
+        waitForStop = "infinite" in arguments or \
+            not any(name in limits for name in ("depth", "nodes", "movetime", "wtime", "btime"))
+
+        self.stopEvent = threading.Event()
+        self.searchThread = threading.Thread(
+            target=self.search, args=(self.state, maxDepth, timeLimit, limits.get("nodes"), waitForStop),
+            daemon=True)
+        self.searchThread.start()
+
+    def get_time_limit(self, limits):
+        """Returns the time budget of the move in milliseconds, or None if the search is not timed. """
+        if "movetime" in limits:
+            return limits["movetime"]
+        clock, increment = ("wtime", "winc") if self.state.whiteToMove else ("btime", "binc")
+        if clock not in limits:
+            return None
+        # share the remaining time between the moves still to play, and spend most of the increment right away
+        timeLimit = limits[clock] / max(limits.get("movestogo", MOVES_TO_GO), 1) + limits.get(increment, 0) * 3 / 4
+        return max(1, min(timeLimit, limits[clock] - MOVE_OVERHEAD))
+
+    def search(self, state, maxDepth, timeLimit, nodeLimit, waitForStop):
+        """Runs on the search thread: searches the position, reporting each iteration, then sends the best move. """
+        start = time.perf_counter()
+
+        def report(search):
+            elapsed = time.perf_counter() - start
+            self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(
+                search.completedDepth, format_score(search.score), search.nodes,
+                int(search.nodes / elapsed) if elapsed > 0 else 0, int(elapsed * 1000),
+                " ".join(move.get_uci_notation() for move in search.pv)))
+
+        validMoves = state.get_valid_moves()
+        bestMove, _ = move_finder.get_best_move_iterative(
+            state, validMoves, timeLimit, nodeLimit, maxDepth, self.table, self.stopEvent, report,
+            ordering=self.ordering)
+        if waitForStop:
+            self.stopEvent.wait()
+        # "0000" is the null move UCI expects when there is no move to play (checkmate or stalemate)
+        self.send("bestmove " + (bestMove.get_uci_notation() if bestMove else "0000"))
+
+    def stop(self):
+        """Stops the search in progress, if any, and waits for it to send its best move. """
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def format_score(score):
+    """
+    Converts a search score (in pawns, for the side to move) to UCI: "cp <centipawns>", or "mate <moves>"
+    (negative when getting mated) for a forced checkmate, whose distance in plies the score gives
+    (see move_finder.MATE_BOUND).
+    """
+    if abs(score) >= move_finder.MATE_BOUND:
+        moves = (round(move_finder.CHECKMATE - abs(score)) + 1) // 2
+        return "mate {}".format(moves if score > 0 else -moves)
+    return "cp {}".format(round(score * 100))
+
+
+def main():
+    """Reads commands from stdin until quit (or the end of the input). """
+    uciEngine = UCIEngine()
+    for line in sys.stdin:
+        if not uciEngine.handle(line):
+            break
+    else:
+        uciEngine.stop()
+
+
+if __name__ == "__main__":
+    main()